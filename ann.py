@@ -0,0 +1,83 @@
+import numpy as np
+from sklearn.cluster import MiniBatchKMeans
+from sklearn.decomposition import TruncatedSVD
+from sklearn.preprocessing import normalize
+
+# Size of the dense embeddings and how many inverted lists a query scans by default
+ANN_COMPONENTS = 128
+ANN_NPROBE = 8
+
+
+# Approximate nearest neighbour index over low-rank book embeddings.
+# TruncatedSVD projects the tf-idf rows into a small dense space, the unit length float32 embeddings
+# are grouped by k-means into inverted lists (IVF), and a query only scans the lists whose centroids
+# are closest to it. More probed lists means better recall and slower queries
+class AnnIndex:
+    def __init__(self, tfidf_matrix, n_components=ANN_COMPONENTS, n_lists=None, random_state=0):
+        n_books, n_terms = tfidf_matrix.shape
+        n_components = max(1, min(n_components, n_terms - 1, n_books - 1))
+        self.svd = TruncatedSVD(n_components=n_components, random_state=random_state)
+        embeddings = self.svd.fit_transform(tfidf_matrix)
+
+        # About sqrt(n) lists keeps both the centroid scan and the list scans short
+        if n_lists is None:
+            n_lists = int(np.sqrt(n_books))
+        n_lists = max(1, min(n_lists, n_books))
+        self.embeddings = np.ascontiguousarray(normalize(embeddings), dtype=np.float32)
+        kmeans = MiniBatchKMeans(n_clusters=n_lists, random_state=random_state, n_init=3)
+        self.labels = kmeans.fit_predict(self.embeddings)
+        self.centroids = np.ascontiguousarray(normalize(kmeans.cluster_centers_), dtype=np.float32)
+        self.build_lists()
+
+    # Groups the book ids by list, with each list's embeddings stored next to each other
+    def build_lists(self):
+        order = np.argsort(self.labels, kind='stable')
+        self.list_ids = order.astype(np.int64)
+        self.list_indptr = np.searchsorted(self.labels[order], np.arange(len(self.centroids) + 1))
+        self.list_vectors = self.embeddings[order]
+
+    # Projects tf-idf rows into the embedding space
+    def embed(self, vectors):
+        return np.ascontiguousarray(normalize(self.svd.transform(vectors)), dtype=np.float32)
+
+    # A copy with the given rows replaced (ids past the end are appended), placed in their
+    # closest existing list. The projection and the lists themselves are not refitted
+    def with_rows(self, book_ids, vectors):
+        updated = object.__new__(AnnIndex)
+        updated.svd = self.svd
+        updated.centroids = self.centroids
+
+        n_books = max(len(self.embeddings), int(np.max(book_ids)) + 1)
+        updated.embeddings = np.zeros((n_books, self.embeddings.shape[1]), dtype=np.float32)
+        updated.embeddings[:len(self.embeddings)] = self.embeddings
+        updated.labels = np.zeros(n_books, dtype=self.labels.dtype)
+        updated.labels[:len(self.labels)] = self.labels
+
+        embeddings = self.embed(vectors)
+        updated.embeddings[book_ids] = embeddings
+        updated.labels[book_ids] = np.argmax(embeddings @ self.centroids.T, axis=1)
+        updated.build_lists()
+        return updated
+
+    # Returns up to n_candidates book ids whose embeddings are closest to the query,
+    # looking only at the nprobe closest lists and, when given, at the allowed ids
+    def search(self, query_vector, n_candidates, nprobe=ANN_NPROBE, allowed=None):
+        query = self.embed(query_vector)[0]
+        if not query.any():
+            return np.empty(0, dtype=np.int64)
+
+        centroid_scores = self.centroids @ query
+        nprobe = max(1, min(nprobe, len(centroid_scores)))
+        probed = np.argpartition(centroid_scores, len(centroid_scores) - nprobe)[-nprobe:]
+
+        ids = np.concatenate([self.list_ids[self.list_indptr[i]:self.list_indptr[i + 1]] for i in probed])
+        scores = np.concatenate([self.list_vectors[self.list_indptr[i]:self.list_indptr[i + 1]] @ query for i in probed])
+
+        if allowed is not None:
+            keep = np.isin(ids, allowed)
+            ids, scores = ids[keep], scores[keep]
+
+        if len(ids) > n_candidates:
+            best = np.argpartition(scores, len(scores) - n_candidates)[-n_candidates:]
+            ids = ids[best]
+        return np.sort(ids)
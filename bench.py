@@ -0,0 +1,301 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tkinter as tk
+
+import numpy as np
+import pandas as pd
+import sklearn
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+import data
+from engine import default_engine
+from heap import HeapRenderer, bfs_search, create_max_heap, dfs_search, draw_heap_bfs, draw_heap_dfs
+
+# The catalog the synthetic ones are scaled from, and where the generated CSVs are kept between runs
+BASE_CSV = 'data/BooksDataset_copy.csv'
+WORK_DIR = 'data/bench'
+
+# Thresholds every filter combination is searched with, heap sizes and batch sizes that are measured
+MIN_SIMILARITIES = [0.3, 0.0]
+HEAP_SIZES = [10, 100, 1000, 10000, 100000]
+BATCH_SIZES = [16, 64]
+
+# Size of the canvas heaps are rendered on, about the visualization tab of the GUI
+RENDER_WIDTH = 1200
+RENDER_HEIGHT = 700
+
+
+# Latency summary of a list of timings in seconds
+def summarize(timings):
+    timings_ms = np.asarray(timings) * 1000
+    return {
+        'n': len(timings_ms),
+        'mean_ms': float(timings_ms.mean()),
+        'min_ms': float(timings_ms.min()),
+        'p50_ms': float(np.percentile(timings_ms, 50)),
+        'p95_ms': float(np.percentile(timings_ms, 95)),
+        'p99_ms': float(np.percentile(timings_ms, 99)),
+        'max_ms': float(timings_ms.max()),
+    }
+
+
+# Calls function once per argument tuple and returns the time each call took
+def time_calls(function, calls):
+    timings = []
+    for args in calls:
+        started = time.perf_counter()
+        function(*args)
+        timings.append(time.perf_counter() - started)
+    return timings
+
+
+# Writes (or reuses) a catalog scale times the size of the base one. Every copy of a book gets a few
+# words drawn from the whole catalog plus some made-up long tail words, so the copies differ and
+# the vocabulary keeps growing with the catalog like a real one would
+def synthetic_catalog(base_csv, scale, work_dir=WORK_DIR, seed=0):
+    csv_path = os.path.join(work_dir, f'synthetic_{scale}x_seed{seed}.csv')
+    if os.path.exists(csv_path):
+        return csv_path
+
+    base = pd.read_csv(base_csv, usecols=data.CSV_COLUMNS, dtype=str)
+    rng = np.random.default_rng(seed)
+    words = np.array(' '.join(base['Description'].dropna()).split())
+
+    n_books = len(base) * scale
+    frame = base.iloc[np.tile(np.arange(len(base)), scale)].reset_index(drop=True)
+    copies = np.repeat(np.arange(scale), len(base))
+
+    extra_words = rng.choice(words, size=(n_books, 3))
+    tail_words = np.char.add('w', rng.zipf(1.5, size=(n_books, 2)).astype(str))
+    extra = [' '.join(row) for row in np.concatenate([extra_words, tail_words], axis=1)]
+    frame['Description'] = frame['Description'].fillna('') + ' ' + pd.Series(extra)
+    frame['Title'] = np.where(copies > 0, frame['Title'] + ' ' + copies.astype(str), frame['Title'])
+
+    os.makedirs(work_dir, exist_ok=True)
+    frame.to_csv(csv_path + '.tmp', index=False)
+    os.replace(csv_path + '.tmp', csv_path)
+    return csv_path
+
+
+# CSV load, category cleaning, the one-shot TfidfVectorizer fit and the streamed index build
+def bench_build(csv_path, record):
+    started = time.perf_counter()
+    frame = pd.read_csv(csv_path, usecols=data.CSV_COLUMNS, dtype=str)
+    record('csv_load', {}, [time.perf_counter() - started])
+
+    categories = frame['Category']
+    record('clean_category', {'method': 'per_row'}, time_calls(lambda: categories.map(data.clean_category), [()]))
+    record('clean_category', {'method': 'factorized'}, time_calls(data.clean_categories, [(categories,)]))
+
+    frame['Category'] = data.clean_categories(categories)
+    text = data.catalog_text(frame)
+    record('tfidf_fit_transform', {},
+           time_calls(lambda: TfidfVectorizer(stop_words='english').fit_transform(text), [()]))
+
+    started = time.perf_counter()
+    index = data.SearchIndex(*data.build_index(csv_path))
+    record('build_index', {}, [time.perf_counter() - started])
+    return index
+
+
+# Query strings taken from the titles of random books
+def sample_queries(index, n_queries, rng):
+    titles = index.catalog.titles.take(rng.integers(0, len(index.catalog), n_queries))
+    return [' '.join(str(title).split()[:3]) for title in titles]
+
+
+# The most common category, and the first name of the most common author, as filters. Authors are
+# listed as "By <name>", and books without one only say "By", which would match every book
+def sample_filters(index):
+    catalog = index.catalog
+    category = catalog.categories[np.bincount(catalog.category_codes).argmax()]
+
+    author_codes = np.asarray(catalog.author_codes)
+    counts = np.bincount(author_codes[author_codes >= 0], minlength=len(catalog.author_names))
+    author = None
+    for code in np.argsort(-counts, kind='stable').tolist():
+        name = catalog.author_names[code].removeprefix('By').strip()
+        if name:
+            author = name.split()[0].strip(',')
+            break
+
+    filters = [('none', None, None), ('category', category, None)]
+    if author is not None:
+        filters += [('author', None, author), ('category+author', category, author)]
+    return filters
+
+
+# find_similar_books latency for every filter combination, with the caches cleared so every call is scored
+def bench_queries(index, queries, record):
+    def search(query, category, author, min_similarity, mode):
+        default_engine.result_cache.clear()
+        default_engine.query_vector_cache.clear()
+        default_engine.find_similar_books(query, 10, min_similarity, category, author, mode=mode)
+
+    for name, category, author in sample_filters(index):
+        for min_similarity in MIN_SIMILARITIES:
+            calls = [(query, category, author, min_similarity, 'exact') for query in queries]
+            record('find_similar_books', {'filter': name, 'min_similarity': min_similarity},
+                   time_calls(search, calls))
+
+    # The approximate index is built outside the timed calls
+    started = time.perf_counter()
+    index.ann
+    record('ann_build', {}, [time.perf_counter() - started])
+    calls = [(query, None, None, 0.3, 'ann') for query in queries]
+    record('find_similar_books', {'filter': 'none', 'min_similarity': 0.3, 'mode': 'ann'}, time_calls(search, calls))
+
+    for name, category, author in sample_filters(index):
+        for batch_size in BATCH_SIZES:
+            calls = [(queries[start:start + batch_size], category, author)
+                     for start in range(0, len(queries), batch_size)]
+            record('find_similar_books_batch', {'filter': name, 'batch_size': batch_size},
+                   time_calls(lambda batch, category, author:
+                              default_engine.find_similar_books_batch(batch, 10, 0.3, category, author), calls))
+
+
+# Heap construction and BFS/DFS lookups on heaps of growing size
+def bench_heap(index, rng, record, lookups=50):
+    for size in sorted({min(size, len(index.catalog)) for size in HEAP_SIZES}):
+        doc_ids = rng.choice(len(index.catalog), size, replace=False)
+        results = index.results(doc_ids, rng.random(size))
+        record('create_max_heap', {'size': size}, time_calls(create_max_heap, [(results,)] * lookups))
+
+        heap = create_max_heap(results)
+        targets = [heap[i][1] for i in rng.integers(0, len(heap), lookups)]
+        record('bfs_search', {'size': size}, time_calls(bfs_search, [(heap, target) for target in targets]))
+        record('dfs_search', {'size': size}, time_calls(dfs_search, [(heap, target) for target in targets]))
+        record('indexed_bfs_visits', {'size': size}, time_calls(heap.bfs_visits, [(target,) for target in targets]))
+
+
+# What the GUI spends its time on after a search: drawing the heap, scrolling it, and setting up the
+# BFS/DFS animations. Runs on a canvas in a withdrawn Tk root, and is skipped when there is no display
+def bench_render(index, rng, record, repeats=20):
+    try:
+        root = tk.Tk()
+    except tk.TclError as e:
+        print(f"Skipping the rendering benchmarks: {e}", file=sys.stderr)
+        return
+
+    try:
+        root.withdraw()
+        canvas = tk.Canvas(root, width=RENDER_WIDTH, height=RENDER_HEIGHT)
+        canvas.pack()
+        renderer = HeapRenderer(canvas)
+
+        for size in sorted({min(size, len(index.catalog)) for size in HEAP_SIZES}):
+            doc_ids = rng.choice(len(index.catalog), size, replace=False)
+            heap = create_max_heap(index.results(doc_ids, rng.random(size)))
+
+            def draw():
+                renderer.draw(heap, RENDER_WIDTH // 2, 50)
+                canvas.update_idletasks()
+            record('heap_render', {'size': size}, time_calls(draw, [()] * repeats))
+
+            def scroll(fraction):
+                renderer.xview('moveto', fraction)
+                canvas.update_idletasks()
+            record('heap_render_scroll', {'size': size},
+                   time_calls(scroll, [(fraction,) for fraction in rng.random(repeats)]))
+            renderer.clear()
+
+            for order, draw_traversal in (('bfs', draw_heap_bfs), ('dfs', draw_heap_dfs)):
+                def animate():
+                    animation = draw_traversal(canvas, heap, RENDER_WIDTH // 2, 50)
+                    animation.cancel()
+                    canvas.update_idletasks()
+                    canvas.delete('animation')
+                record(f'draw_heap_{order}', {'size': size}, time_calls(animate, [()] * repeats))
+    finally:
+        root.destroy()
+
+
+def run_benchmarks(args):
+    rng = np.random.default_rng(args.seed)
+    results = []
+
+    for scale in args.scales:
+        csv_path = synthetic_catalog(args.base_csv, scale, args.work_dir, args.seed)
+
+        def record(benchmark, params, timings):
+            results.append(dict({'scale': scale, 'benchmark': benchmark, 'params': params}, **summarize(timings)))
+            print(f"{scale}x {benchmark} {params}: p50 {results[-1]['p50_ms']:.2f} ms", file=sys.stderr)
+
+        index = bench_build(csv_path, record)
+        default_engine.set_index(index)
+        bench_queries(index, sample_queries(index, args.queries, rng), record)
+        bench_heap(index, rng, record)
+        bench_render(index, rng, record)
+
+    return results
+
+
+# Where and with what the benchmarks ran, so runs from different commits can be told apart
+def environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'commit': commit,
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'sklearn': sklearn.__version__,
+    }
+
+
+# Prints the benchmarks whose median got slower than in a saved run, returns how many did
+def compare(results, baseline_path, threshold):
+    with open(baseline_path, encoding='utf-8') as f:
+        baseline = {(r['scale'], r['benchmark'], json.dumps(r['params'], sort_keys=True)): r
+                    for r in json.load(f)['results']}
+
+    regressions = 0
+    for result in results:
+        before = baseline.get((result['scale'], result['benchmark'], json.dumps(result['params'], sort_keys=True)))
+        if before is None or before['p50_ms'] <= 0:
+            continue
+        ratio = result['p50_ms'] / before['p50_ms']
+        if ratio > 1 + threshold:
+            regressions += 1
+            print(f"SLOWER {result['scale']}x {result['benchmark']} {result['params']}: "
+                  f"p50 {before['p50_ms']:.2f} -> {result['p50_ms']:.2f} ms ({ratio:.2f}x)", file=sys.stderr)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark index build, search latency, heap operations and rendering")
+    parser.add_argument('--scales', type=lambda text: [int(scale) for scale in text.split(',')], default=[10, 100, 1000],
+                        help="comma separated catalog sizes, as multiples of the base CSV")
+    parser.add_argument('--queries', type=int, default=200, help="queries per latency benchmark")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--base-csv', default=BASE_CSV)
+    parser.add_argument('--work-dir', default=WORK_DIR, help="folder for the generated catalogs")
+    parser.add_argument('--output', help="JSON results file (printed when not given)")
+    parser.add_argument('--compare', help="results file of an earlier run to check for regressions")
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help="slowdown of the median that counts as a regression")
+    args = parser.parse_args()
+
+    report = {'environment': environment(), 'results': run_benchmarks(args)}
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+    if args.compare and compare(report['results'], args.compare, args.threshold):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
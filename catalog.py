@@ -0,0 +1,216 @@
+import json
+import os
+from functools import cached_property
+
+import numpy as np
+import pandas as pd
+
+# Strings packed end to end into one utf-8 buffer: row i is buffer[starts[i]:ends[i]], missing values
+# have a start of -1. Rows changed since the buffer was packed are kept in a small overlay dict instead,
+# so an update never copies (or, when it is memory mapped, reads) the buffer. repacked() folds them in
+class StringColumn:
+    def __init__(self, buffer, starts, ends, overlay=None, length=None):
+        self.buffer = buffer
+        self.starts = starts
+        self.ends = ends
+        self.overlay = {} if overlay is None else overlay
+        self.length = len(starts) if length is None else length
+
+    @classmethod
+    def from_strings(cls, values):
+        encoded = [value.encode('utf-8') if isinstance(value, str) else None for value in values]
+        lengths = np.fromiter((0 if value is None else len(value) for value in encoded), dtype=np.int64,
+                              count=len(encoded))
+        ends = np.cumsum(lengths)
+        starts = ends - lengths
+        missing = np.fromiter((value is None for value in encoded), dtype=bool, count=len(encoded))
+        starts[missing] = -1
+        ends[missing] = -1
+
+        buffer = np.frombuffer(b''.join(value for value in encoded if value is not None), dtype=np.uint8)
+        return cls(buffer, starts, ends)
+
+    # One column with the rows of every column in turn
+    @classmethod
+    def concat(cls, columns):
+        columns = [column.repacked() for column in columns]
+        shifts = np.cumsum([0] + [len(column.buffer) for column in columns[:-1]])
+        starts = [np.where(column.starts < 0, -1, column.starts + shift) for column, shift in zip(columns, shifts)]
+        ends = [np.where(column.starts < 0, -1, column.ends + shift) for column, shift in zip(columns, shifts)]
+        return cls(np.concatenate([column.buffer for column in columns]), np.concatenate(starts), np.concatenate(ends))
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, row):
+        if row in self.overlay:
+            return self.overlay[row]
+        start = self.starts[row]
+        if start < 0:
+            return None
+        return bytes(self.buffer[start:self.ends[row]]).decode('utf-8')
+
+    # The strings of the given rows as an object array, None where missing
+    def take(self, rows):
+        return np.array([self[row] for row in np.asarray(rows).tolist()] + [None], dtype=object)[:-1]
+
+    # A copy with the given rows replaced by values, rows past the end are appended.
+    # The copy shares the buffer, only the overlay is copied
+    def with_rows(self, rows, values):
+        rows = np.asarray(rows, dtype=np.int64).tolist()
+        overlay = dict(self.overlay)
+        for row, value in zip(rows, values):
+            overlay[row] = value if isinstance(value, str) else None
+        return StringColumn(self.buffer, self.starts, self.ends, overlay, max([self.length] + [row + 1 for row in rows]))
+
+    # The column packed into a fresh buffer with the overlay folded in and replaced strings dropped
+    def repacked(self):
+        if not self.overlay:
+            return self
+        return StringColumn.from_strings(self.take(np.arange(len(self))))
+
+    def save(self, directory, name):
+        column = self.repacked()
+        np.save(os.path.join(directory, f'{name}_buffer.npy'), column.buffer)
+        np.save(os.path.join(directory, f'{name}_starts.npy'), column.starts)
+        np.save(os.path.join(directory, f'{name}_ends.npy'), column.ends)
+
+    # The arrays are memory mapped, so only the strings that are read are paged in
+    @classmethod
+    def load(cls, directory, name):
+        return cls(*(np.load(os.path.join(directory, f'{name}_{part}.npy'), mmap_mode='r')
+                     for part in ('buffer', 'starts', 'ends')))
+
+
+# The book metadata search needs, without a DataFrame: titles and descriptions as string columns,
+# authors as codes into their distinct names and categories as small int codes into the category names.
+# A saved catalog only reads its descriptions when an update or a refit asks for them
+class Catalog:
+    def __init__(self, titles, author_names, author_codes, categories, category_codes, descriptions=None,
+                 directory=None):
+        self.titles = titles
+        self.author_names = author_names
+        self.author_codes = author_codes
+        self.categories = categories
+        self.category_codes = category_codes
+        self.directory = directory
+        if descriptions is not None:
+            self.descriptions = descriptions
+
+    # Catalog of a frame with the catalog columns and Category as a categorical
+    @classmethod
+    def from_frame(cls, frame):
+        author_codes, author_names = pd.factorize(frame['Authors'])
+        categories = frame['Category'].cat.categories.tolist()
+        return cls(StringColumn.from_strings(frame['Title']), StringColumn.from_strings(author_names),
+                   author_codes.astype(np.int32), categories, frame['Category'].cat.codes.to_numpy(np.int8),
+                   StringColumn.from_strings(frame['Description']))
+
+    # One catalog with the books of every catalog in turn, their author names merged
+    @classmethod
+    def concat(cls, catalogs):
+        names = {}
+        author_codes = []
+        for catalog in catalogs:
+            remap = np.array([names.setdefault(name, len(names)) for name in catalog.author_names.take(
+                np.arange(len(catalog.author_names)))] + [-1], dtype=np.int32)
+            author_codes.append(remap[catalog.author_codes])
+
+        return cls(StringColumn.concat([catalog.titles for catalog in catalogs]), StringColumn.from_strings(list(names)),
+                   np.concatenate(author_codes), catalogs[0].categories,
+                   np.concatenate([catalog.category_codes for catalog in catalogs]),
+                   StringColumn.concat([catalog.descriptions for catalog in catalogs]))
+
+    def __len__(self):
+        return len(self.titles)
+
+    @cached_property
+    def descriptions(self):
+        return StringColumn.load(self.directory, 'descriptions')
+
+    # Code of every distinct author name, for updates
+    @cached_property
+    def author_lookup(self):
+        return {name: code for code, name in enumerate(self.author_names.take(np.arange(len(self.author_names))))}
+
+    # The authors of the given books as an object array, None where unknown
+    def authors(self, book_ids):
+        codes = self.author_codes[book_ids]
+        names = self.author_names.take(np.maximum(codes, 0))
+        names[codes < 0] = None
+        return names
+
+    # The books start to stop with the catalog columns
+    def frame(self, start=0, stop=None):
+        book_ids = np.arange(start, len(self) if stop is None else min(stop, len(self)))
+        return pd.DataFrame({
+            'Title': self.titles.take(book_ids),
+            'Authors': self.authors(book_ids),
+            'Description': self.descriptions.take(book_ids),
+            'Category': pd.Categorical.from_codes(self.category_codes[book_ids], categories=self.categories),
+        }, index=book_ids)
+
+    # One book as a dict of the catalog columns
+    def book(self, book_id):
+        return {'Title': self.titles[book_id], 'Authors': self.authors([book_id])[0],
+                'Description': self.descriptions[book_id],
+                'Category': self.categories[self.category_codes[book_id]]}
+
+    # A copy with the books of book_ids replaced by the rows of frame (ids past the end are appended)
+    def with_rows(self, book_ids, frame):
+        book_ids = np.asarray(book_ids, dtype=np.int64)
+        n_books = max(len(self), int(book_ids.max()) + 1 if len(book_ids) else 0)
+
+        # New author names are appended to the distinct names
+        author_lookup = dict(self.author_lookup)
+        new_names = []
+        added_codes = []
+        for name in frame['Authors']:
+            if not isinstance(name, str):
+                added_codes.append(-1)
+                continue
+            if name not in author_lookup:
+                author_lookup[name] = len(author_lookup)
+                new_names.append(name)
+            added_codes.append(author_lookup[name])
+        author_names = self.author_names
+        if new_names:
+            author_names = author_names.with_rows(np.arange(len(author_names), len(author_names) + len(new_names)),
+                                                  new_names)
+
+        author_codes = np.full(n_books, -1, dtype=np.int32)
+        author_codes[:len(self)] = self.author_codes
+        author_codes[book_ids] = added_codes
+
+        category_codes = np.zeros(n_books, dtype=np.int8)
+        category_codes[:len(self)] = self.category_codes
+        category_codes[book_ids] = pd.Index(self.categories).get_indexer(frame['Category'].astype(str))
+
+        changed = Catalog(self.titles.with_rows(book_ids, frame['Title']), author_names, author_codes,
+                          self.categories, category_codes, self.descriptions.with_rows(book_ids, frame['Description']))
+        changed.author_lookup = author_lookup
+        return changed
+
+    # A copy with every column repacked, so the strings replaced by updates are freed.
+    # Descriptions that were never read stay unread
+    def repacked(self):
+        descriptions = self.__dict__.get('descriptions')
+        return Catalog(self.titles.repacked(), self.author_names.repacked(), self.author_codes, self.categories,
+                       self.category_codes, None if descriptions is None else descriptions.repacked(), self.directory)
+
+    def save(self, directory):
+        self.titles.save(directory, 'titles')
+        self.author_names.save(directory, 'author_names')
+        self.descriptions.save(directory, 'descriptions')
+        np.save(os.path.join(directory, 'author_codes.npy'), self.author_codes)
+        np.save(os.path.join(directory, 'category_codes.npy'), self.category_codes)
+        with open(os.path.join(directory, 'catalog.json'), 'w', encoding='utf-8') as f:
+            json.dump({'categories': self.categories}, f)
+
+    @classmethod
+    def load(cls, directory):
+        with open(os.path.join(directory, 'catalog.json'), encoding='utf-8') as f:
+            categories = json.load(f)['categories']
+        return cls(StringColumn.load(directory, 'titles'), StringColumn.load(directory, 'author_names'),
+                   np.load(os.path.join(directory, 'author_codes.npy'), mmap_mode='r'), categories,
+                   np.load(os.path.join(directory, 'category_codes.npy'), mmap_mode='r'), directory=directory)
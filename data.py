@@ -1,10 +1,102 @@
+import heapq
+import itertools
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import cached_property
+
+import numpy as np
 import pandas as pd
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
+import sklearn
+from scipy import sparse
+from sklearn.feature_extraction.text import CountVectorizer, TfidfVectorizer
+from sklearn.preprocessing import normalize
+
+import instrumentation
+from ann import AnnIndex
+from catalog import Catalog
+from engine import default_engine, file_path, index_dir
+from expansion import QueryExpander
+from neighbours import build_neighbours, load_neighbours, save_neighbours
+
+INDEX_VERSION = 4
+
+# Only these columns of the CSV are used by search, read this many rows at a time
+CSV_COLUMNS = ['Title', 'Authors', 'Description', 'Category']
+CSV_CHUNK_ROWS = 20000
+
+# Updates start a background refit once idf_drift() passes this,
+# or once this many words from added books are missing from the vocabulary
+IDF_DRIFT_THRESHOLD = 0.02
+NEW_TERMS_THRESHOLD = 200
+
+# The approximate search re-ranks this many candidates per requested result (at least ANN_MIN_RERANK)
+# with the exact tf-idf cosine
+ANN_RERANK_FACTOR = 5
+ANN_MIN_RERANK = 100
+
+# Full scans of at least 2 * SCORE_SHARD_ROWS books are split into up to SCORE_SHARDS row shards,
+# scored on a thread pool (the sparse kernels release the GIL)
+SCORE_SHARDS = os.cpu_count() or 1
+SCORE_SHARD_ROWS = 50000
 
-# Loading CSV file
-file_path = 'data/BooksDataset.csv'
-data = pd.read_csv(file_path)
+# Results a ResultCursor sorts and hands out at a time
+CURSOR_PAGE_SIZE = 100
+
+# Largest query-by-book score block a batch search holds in memory at once
+BATCH_BLOCK_BYTES = 64 * 1024 * 1024
+
+
+# Dictionary of category mappings, the first key found in a category wins
+category_mapping = {
+    'Antiques & Collectibles': 'Antiques & Collectibles',
+    'Architecture': 'Architecture & Design',
+    'Design': 'Architecture & Design',
+    'Art': 'Art',
+    'Biography': 'Biography & Autobiography',
+    'Autobiography': 'Biography & Autobiography',
+    'Business': 'Business & Economics',
+    'Economics': 'Business & Economics',
+    'Computers': 'Computer & Technology',
+    'Technology': 'Computer & Technology',
+    'Cooking': 'Cooking & Food',
+    'Food': 'Cooking & Food',
+    'Crafts': 'Crafts & Hobbies',
+    'Hobbies': 'Crafts & Hobbies',
+    'Education': 'Education',
+    'Fiction': 'Fiction',
+    'Health': 'Health & Fitness',
+    'Fitness': 'Health & Fitness',
+    'History': 'History',
+    'House': 'Home & Garden',
+    'Garden': 'Home & Garden',
+    'Humor': 'Humor',
+    'Law': 'Law',
+    'Literary': 'Literature',
+    'Mathematics': 'Mathematics',
+    'Medical': 'Medical',
+    'Music': 'Music',
+    'Nature': 'Nature & Environment',
+    'Philosophy': 'Philosophy',
+    'Photography': 'Photography',
+    'Poetry': 'Poetry',
+    'Psychology': 'Psychology',
+    'Reference': 'Reference',
+    'Religion': 'Religion & Spirituality',
+    'Science': 'Science',
+    'Social Science': 'Social Sciences',
+    'Sports': 'Sports & Recreation',
+    'Recreation': 'Sports & Recreation',
+    'Transportation': 'Transportation',
+    'Travel': 'Travel'
+}
+
+# Lowercased once instead of on every lookup
+category_keys = [(key.lower(), value) for key, value in category_mapping.items()]
+
+# Every cleaned category name, used as the categorical dtype of the Category column
+category_dtype = pd.CategoricalDtype(sorted(set(category_mapping.values()) | {'Other', 'Uncategorized'}))
 
 
 # Clean and consolidate categories 
@@ -13,94 +105,943 @@ def clean_category(category):
         return 'Uncategorized'
 
     # Split categories on comma and get the main category
-    main_category = category.split(',')[0].strip()
-
-    # Dictionary of category mappings
-    category_mapping = {
-        'Antiques & Collectibles': 'Antiques & Collectibles',
-        'Architecture': 'Architecture & Design',
-        'Design': 'Architecture & Design',
-        'Art': 'Art',
-        'Biography': 'Biography & Autobiography',
-        'Autobiography': 'Biography & Autobiography',
-        'Business': 'Business & Economics',
-        'Economics': 'Business & Economics',
-        'Computers': 'Computer & Technology',
-        'Technology': 'Computer & Technology',
-        'Cooking': 'Cooking & Food',
-        'Food': 'Cooking & Food',
-        'Crafts': 'Crafts & Hobbies',
-        'Hobbies': 'Crafts & Hobbies',
-        'Education': 'Education',
-        'Fiction': 'Fiction',
-        'Health': 'Health & Fitness',
-        'Fitness': 'Health & Fitness',
-        'History': 'History',
-        'House': 'Home & Garden',
-        'Garden': 'Home & Garden',
-        'Humor': 'Humor',
-        'Law': 'Law',
-        'Literary': 'Literature',
-        'Mathematics': 'Mathematics',
-        'Medical': 'Medical',
-        'Music': 'Music',
-        'Nature': 'Nature & Environment',
-        'Philosophy': 'Philosophy',
-        'Photography': 'Photography',
-        'Poetry': 'Poetry',
-        'Psychology': 'Psychology',
-        'Reference': 'Reference',
-        'Religion': 'Religion & Spirituality',
-        'Science': 'Science',
-        'Social Science': 'Social Sciences',
-        'Sports': 'Sports & Recreation',
-        'Recreation': 'Sports & Recreation',
-        'Transportation': 'Transportation',
-        'Travel': 'Travel'
-    }
+    main_category = category.split(',')[0].strip().lower()
 
     # Look for matching category in our mapping
-    for key in category_mapping:
-        if key.lower() in main_category.lower():
-            return category_mapping[key]
+    for key, value in category_keys:
+        if key in main_category:
+            return value
 
     return 'Other'
 
 
-# Apply cleaning to the dataset
-data['Category'] = data['Category'].apply(clean_category)
+# Cleans a whole column: each distinct raw category is cleaned once and broadcast back through its code
+def clean_categories(categories):
+    codes, uniques = pd.factorize(categories)
+
+    # Missing values get code -1, which picks the trailing 'Uncategorized'
+    cleaned = [clean_category(category) for category in uniques] + ['Uncategorized']
+    cleaned_codes = category_dtype.categories.get_indexer(cleaned)
+
+    return pd.Series(pd.Categorical.from_codes(cleaned_codes[codes], dtype=category_dtype),
+                     index=categories.index, name=categories.name)
+
+
+# Creates the text for similarity calculation
+def catalog_text(frame):
+    return (frame['Title'].fillna('').astype(str) + ' ' + frame['Authors'].astype(object).fillna('').astype(str) + ' ' +
+            frame['Description'].fillna('').astype(str) + ' ' + frame['Category'].astype(str))
+
+
+# Streams the search columns of the CSV in chunks, with categories cleaned and the text for similarity built
+def read_catalog_chunks(csv_path, chunk_rows=CSV_CHUNK_ROWS):
+    for chunk in pd.read_csv(csv_path, usecols=CSV_COLUMNS, dtype=str, chunksize=chunk_rows):
+        # Apply cleaning to the dataset
+        chunk['Category'] = clean_categories(chunk['Category'])
+        yield chunk, catalog_text(chunk)
+
+
+# Fits the TF-IDF model over chunks of text, giving the same result as one fit_transform.
+# n_documents overrides the row count used for idf when some rows are deleted books
+def fit_tfidf(text_chunks, n_documents=None):
+    # Each chunk is tokenized once into term counts with its own vocabulary, so only one chunk of text is held
+    count_blocks = []
+    chunk_terms = []
+    for text in text_chunks:
+        counter = CountVectorizer(stop_words='english')
+        try:
+            count_blocks.append(counter.fit_transform(text))
+            chunk_terms.append(counter.get_feature_names_out())
+        except ValueError:
+            # Nothing but stop words in this chunk
+            count_blocks.append(sparse.csr_matrix((len(text), 0), dtype=np.int64))
+            chunk_terms.append(np.empty(0, dtype=object))
+
+    # Sorted vocabulary over all chunks, then the chunk columns are renumbered into it
+    terms = sorted(set().union(*chunk_terms))
+    vocabulary = {term: i for i, term in enumerate(terms)}
+    for i, (counts, local_terms) in enumerate(zip(count_blocks, chunk_terms)):
+        # Both vocabularies are sorted, so the renumbering keeps every row's columns in order
+        columns = np.array([vocabulary[term] for term in local_terms], dtype=np.int64)
+        count_blocks[i] = sparse.csr_matrix((counts.data, columns[counts.indices], counts.indptr),
+                                            shape=(counts.shape[0], len(terms)))
+    counts = sparse.vstack(count_blocks, format='csr')
+    del count_blocks
+
+    # Smoothed idf from the document frequencies, exactly as TfidfVectorizer computes it
+    if n_documents is None:
+        n_documents = counts.shape[0]
+    document_frequency = np.bincount(counts.indices, minlength=len(terms))
+    tfidf_vectorizer = TfidfVectorizer(stop_words='english')
+    tfidf_vectorizer.vocabulary_ = vocabulary
+    tfidf_vectorizer.idf_ = smoothed_idf(document_frequency, n_documents)
+
+    # Compute TF-IDF matrix in place over the counts
+    tfidf_matrix = counts.astype(np.float64)
+    del counts
+    tfidf_matrix.data *= tfidf_vectorizer.idf_[tfidf_matrix.indices]
+    normalize(tfidf_matrix, copy=False)
+    return tfidf_vectorizer, tfidf_matrix
+
+
+# Smoothed idf weights, as TfidfVectorizer computes them
+def smoothed_idf(document_frequency, n_documents):
+    return np.log((1 + n_documents) / (1 + document_frequency)) + 1
+
+
+# Reads the CSV chunk by chunk and fits the TF-IDF model.
+# Each chunk is packed into a compact catalog right away, its text is dropped once it is vectorized
+def build_index(csv_path, chunk_rows=CSV_CHUNK_ROWS):
+    catalogs = []
+
+    def chunk_text():
+        for chunk, text in read_catalog_chunks(csv_path, chunk_rows):
+            catalogs.append(Catalog.from_frame(chunk))
+            yield text
+
+    tfidf_vectorizer, tfidf_matrix = fit_tfidf(chunk_text())
+    return Catalog.concat(catalogs), tfidf_vectorizer, tfidf_matrix
+
+
+# Identifies the CSV (and the library versions) a saved index was built from
+def index_fingerprint(csv_path):
+    stat = os.stat(csv_path)
+    return {
+        'version': INDEX_VERSION,
+        'csv': os.path.abspath(csv_path),
+        'size': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns,
+        'pandas': pd.__version__,
+        'sklearn': sklearn.__version__,
+    }
+
+
+# Writes the vocabulary, idf weights, CSR arrays and the catalog to disk
+def save_index(directory, fingerprint, catalog, tfidf_vectorizer, tfidf_matrix):
+    os.makedirs(directory, exist_ok=True)
+
+    # The manifest is removed first and written last so a half written index is never loaded
+    manifest_path = os.path.join(directory, 'manifest.json')
+    if os.path.exists(manifest_path):
+        os.remove(manifest_path)
+
+    np.save(os.path.join(directory, 'tfidf_data.npy'), tfidf_matrix.data)
+    np.save(os.path.join(directory, 'tfidf_indices.npy'), tfidf_matrix.indices)
+    np.save(os.path.join(directory, 'tfidf_indptr.npy'), tfidf_matrix.indptr)
+    np.save(os.path.join(directory, 'idf.npy'), tfidf_vectorizer.idf_)
+
+    # Terms are stored in column order so the list position is the column index
+    with open(os.path.join(directory, 'vocabulary.json'), 'w', encoding='utf-8') as f:
+        json.dump(tfidf_vectorizer.get_feature_names_out().tolist(), f)
+
+    catalog.save(directory)
+
+    manifest = dict(fingerprint, shape=list(tfidf_matrix.shape))
+    with open(manifest_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f)
+
+
+# Loads a saved index, or returns None if it is missing or was built from a different CSV
+def load_saved_index(directory, fingerprint):
+    try:
+        with open(os.path.join(directory, 'manifest.json'), encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    shape = tuple(manifest.pop('shape', ()))
+    if manifest != fingerprint:
+        return None
+
+    try:
+        # The matrix arrays are memory mapped instead of read into memory
+        tfidf_matrix = sparse.csr_matrix((
+            np.load(os.path.join(directory, 'tfidf_data.npy'), mmap_mode='r'),
+            np.load(os.path.join(directory, 'tfidf_indices.npy'), mmap_mode='r'),
+            np.load(os.path.join(directory, 'tfidf_indptr.npy'), mmap_mode='r'),
+        ), shape=shape, copy=False)
+
+        with open(os.path.join(directory, 'vocabulary.json'), encoding='utf-8') as f:
+            terms = json.load(f)
+
+        tfidf_vectorizer = TfidfVectorizer(stop_words='english')
+        tfidf_vectorizer.vocabulary_ = {term: i for i, term in enumerate(terms)}
+        tfidf_vectorizer.idf_ = np.load(os.path.join(directory, 'idf.npy'))
+
+        catalog = Catalog.load(directory)
+    except (OSError, ValueError, KeyError):
+        return None
+
+    return catalog, tfidf_vectorizer, tfidf_matrix
+
+
+# Author index over the distinct lowercased author names:
+# every 3 character piece maps to the sorted author codes containing it,
+# and the books of author code c are doc_order[doc_indptr[c]:doc_indptr[c + 1]].
+# author_codes give each book's position in names, -1 for books left out
+def build_author_index(names, author_codes):
+    # Names differing only in case share one code
+    author_names, lower_codes = np.unique(np.array([name.lower() for name in names] + [''], dtype=object)[:-1],
+                                          return_inverse=True)
+    author_codes = np.append(lower_codes, -1)[author_codes]
+
+    doc_order = np.argsort(author_codes, kind='stable')
+    doc_indptr = np.searchsorted(author_codes[doc_order], np.arange(len(author_names) + 1))
+
+    grams = {}
+    for code, name in enumerate(author_names):
+        for gram in {name[i:i + 3] for i in range(len(name) - 2)}:
+            grams.setdefault(gram, []).append(code)
+    author_grams = {gram: np.array(codes, dtype=np.int64) for gram, codes in grams.items()}
+
+    return author_names, author_grams, doc_order, doc_indptr
+
+
+# Uses the saved index when it matches the CSV, otherwise rebuilds and saves it
+def load_index(csv_path=file_path, directory=index_dir):
+    fingerprint = index_fingerprint(csv_path)
+    index = load_saved_index(directory, fingerprint)
+    if index is None:
+        index = build_index(csv_path)
+        try:
+            save_index(directory, fingerprint, *index)
+        except OSError:
+            # A read only folder only costs us the warm start
+            return index
+
+        # Reloaded so the first run also keeps the catalog memory mapped instead of in memory
+        index = load_saved_index(directory, fingerprint) or index
+    return index
+
+
+# Numbers every index version, cached searches are keyed on it
+index_versions = itertools.count()
+
+
+# A cached_property for the expensive parts of an index: when several threads ask for it at once, one builds
+# it and the others wait (functools.cached_property stopped locking in Python 3.12). Each property of each
+# index has its own lock, so a slow build never holds up the others
+class built_once(cached_property):
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return self
+        if self.attrname in instance.__dict__:
+            return instance.__dict__[self.attrname]
+
+        with instance.build_locks.setdefault(self.attrname, threading.Lock()):
+            if self.attrname in instance.__dict__:
+                return instance.__dict__[self.attrname]
+            return super().__get__(instance, owner)
+
+
+class SearchIndex:
+    # One version of the searchable catalog. It is never changed after creation:
+    # updates build a new SearchIndex, so a search keeps a consistent view of the one it started on
+    # directory is the folder the index was saved in, files computed from the matrix (like the neighbour
+    # table) are kept next to it. Indexes changed since they were saved have none
+    def __init__(self, catalog, tfidf_vectorizer, tfidf_matrix, deleted=None, document_frequency=None,
+                 new_terms=frozenset(), directory=None):
+        self.catalog = catalog
+        self.tfidf_vectorizer = tfidf_vectorizer
+        self.tfidf_matrix = tfidf_matrix
+        self.directory = directory
+        self.version = next(index_versions)
+        self.build_locks = {}
+
+        # Removed books keep their row (and id) but have an empty vector and never match
+        self.deleted = np.zeros(len(catalog), dtype=bool) if deleted is None else deleted
+        self.n_documents = len(catalog) - int(self.deleted.sum())
+
+        # Live document frequencies and unknown words, kept up to date by updates between refits
+        if document_frequency is None:
+            document_frequency = np.bincount(tfidf_matrix.indices, minlength=tfidf_matrix.shape[1])
+        self.document_frequency = document_frequency
+        self.new_terms = new_terms
+
+    # The catalog as a DataFrame, built on demand for code that still reads index.data
+    @property
+    def data(self):
+        return self.catalog.frame()
+
+    # Sorted ids of the books that are not deleted
+    @cached_property
+    def live_ids(self):
+        return np.flatnonzero(~self.deleted)
+
+    # Sorted book ids for every category
+    @cached_property
+    def category_ids(self):
+        live = self.live_ids
+        codes = self.catalog.category_codes[live]
+        order = np.argsort(codes, kind='stable')
+        bounds = np.searchsorted(codes[order], np.arange(len(self.catalog.categories) + 1))
+        return {category: live[order[start:stop]] for category, start, stop
+                in zip(self.catalog.categories, bounds[:-1], bounds[1:]) if stop > start}
+
+    # Case-insensitive substring lookups for the author filter
+    @cached_property
+    def author_index(self):
+        author_names = self.catalog.author_names
+        return build_author_index(author_names.take(np.arange(len(author_names))),
+                                  np.where(self.deleted, -1, self.catalog.author_codes))
+
+    # Inverted index: column t of the CSC matrix is the posting list (book ids, weights) of term t
+    @built_once
+    def postings(self):
+        postings = self.tfidf_matrix.tocsc()
+        postings.sort_indices()
+        return postings
+
+    @cached_property
+    def term_max_weight(self):
+        return self.postings.max(axis=0).toarray().ravel()
+
+    @cached_property
+    def term_doc_counts(self):
+        return np.diff(self.postings.indptr)
+
+    @cached_property
+    def row_lengths(self):
+        return np.diff(self.tfidf_matrix.indptr)
+
+    # Approximate nearest neighbour index, built on the first approximate search
+    @built_once
+    def ann(self):
+        return AnnIndex(self.tfidf_matrix)
+
+    # Splits text into the words the vectorizer counts
+    @cached_property
+    def analyzer(self):
+        return self.tfidf_vectorizer.build_analyzer()
+
+    # Completions and spelling corrections over the vocabulary (the engine builds it when the index loads)
+    @cached_property
+    def expander(self):
+        return QueryExpander(self.tfidf_vectorizer.get_feature_names_out().tolist(), self.document_frequency)
+
+    # Precomputed neighbours of every book, read from the index folder or computed (and saved there) on the
+    # first similar_to_book, unless SearchEngine.build_neighbours already did
+    @built_once
+    def neighbours(self):
+        table = None if self.directory is None else load_neighbours(self.directory, self.tfidf_matrix)
+        if table is None:
+            table = build_neighbours(self.tfidf_matrix)
+            if self.directory is not None:
+                try:
+                    save_neighbours(self.directory, self.tfidf_matrix, table)
+                except OSError:
+                    pass
+        return table
+
+    # How far the idf the matrix was built with has moved from the live document frequencies
+    def idf_drift(self):
+        used = self.tfidf_vectorizer.idf_
+        live = smoothed_idf(self.document_frequency, self.n_documents)
+        return float(np.linalg.norm(live - used) / np.linalg.norm(used))
+
+    # Returns the sorted ids of the books whose author contains the text (case-insensitive)
+    def find_author_books(self, author_filter):
+        author_names, author_grams, doc_order, doc_indptr = self.author_index
+        needle = author_filter.lower()
+
+        if len(needle) < 3:
+            # Too short for the trigram index, so check every distinct author
+            codes = range(len(author_names))
+        else:
+            # Only authors containing every trigram of the text can contain the text
+            lists = [author_grams.get(needle[i:i + 3]) for i in range(len(needle) - 2)]
+            if any(codes is None for codes in lists):
+                return np.empty(0, dtype=np.int64)
+            lists.sort(key=len)
+            codes = lists[0]
+            for other in lists[1:]:
+                codes = np.intersect1d(codes, other, assume_unique=True)
+
+        matches = [code for code in codes if needle in author_names[code]]
+        if not matches:
+            return np.empty(0, dtype=np.int64)
+        return np.sort(np.concatenate([doc_order[doc_indptr[c]:doc_indptr[c + 1]] for c in matches]))
+
+    # Returns the sorted ids of the books passing the filters, or None when every book passes
+    def filter_candidates(self, category_filter=None, author_filter=None):
+        candidates = None
+        if category_filter:
+            candidates = self.category_ids.get(category_filter, np.empty(0, dtype=np.int64))
+
+        if author_filter:
+            author_books = self.find_author_books(author_filter)
+            if candidates is None:
+                candidates = author_books
+            else:
+                candidates = np.intersect1d(candidates, author_books, assume_unique=True)
+
+        # Deleted books have zero scores, which still pass a zero min_similarity
+        if candidates is None and self.n_documents < len(self.deleted):
+            candidates = self.live_ids
+
+        return candidates
+
+    # Scores only the books sharing a term with the query, using MaxScore pruning:
+    # terms whose combined best weights stay under the threshold never add new candidates
+    def score_postings(self, query_vector, min_similarity, top_n, candidates=None):
+        postings = self.postings
+        terms = query_vector.indices
+        weights = query_vector.data
+        bounds = weights * self.term_max_weight[terms]
+
+        # Ascending upper bounds, the low ones up to the threshold are the optional terms
+        order = np.argsort(bounds, kind='stable')
+        cumulative = np.cumsum(bounds[order])
+        n_optional = int(np.searchsorted(cumulative, min_similarity))
+        essential, optional = order[n_optional:], order[:n_optional]
+
+        if len(essential) == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+
+        # Accumulate the essential terms over their posting lists only
+        doc_parts = []
+        weight_parts = []
+        for t in essential:
+            start, end = postings.indptr[terms[t]], postings.indptr[terms[t] + 1]
+            doc_parts.append(postings.indices[start:end])
+            weight_parts.append(postings.data[start:end] * weights[t])
+        doc_ids, inverse = np.unique(np.concatenate(doc_parts), return_inverse=True)
+        scores = np.bincount(inverse, weights=np.concatenate(weight_parts))
+
+        if candidates is not None:
+            keep = in_candidates(doc_ids, candidates)
+            doc_ids, scores = doc_ids[keep], scores[keep]
+
+        if n_optional:
+            # Partial scores are lower bounds, so the k-th best one can raise the threshold
+            threshold = min_similarity
+            if len(scores) > top_n > 0:
+                threshold = max(threshold, np.partition(scores, len(scores) - top_n)[len(scores) - top_n])
+
+            # Drop books that cannot reach the threshold even with every optional term
+            keep = scores + cumulative[n_optional - 1] >= threshold
+            doc_ids, scores = doc_ids[keep], scores[keep]
+
+            # Add the optional terms by binary search in their sorted posting lists
+            for t in optional:
+                start, end = postings.indptr[terms[t]], postings.indptr[terms[t] + 1]
+                posting_docs = postings.indices[start:end]
+                positions = np.searchsorted(posting_docs, doc_ids)
+                positions[positions == len(posting_docs)] = 0
+                hit = posting_docs[positions] == doc_ids
+                scores[hit] += postings.data[start + positions[hit]] * weights[t]
+
+        return doc_ids, scores
+
+    # Gathers the titles and authors of the winning books only
+    def results(self, doc_ids, scores):
+        return SearchResults(np.asarray(doc_ids, dtype=np.int64), self.catalog.titles.take(doc_ids),
+                             self.catalog.authors(doc_ids), np.asarray(scores, dtype=np.float64))
+
+
+# One search hit
+class BookMatch:
+    __slots__ = ('book_id', 'title', 'authors', 'similarity')
+
+    def __init__(self, book_id, title, authors, similarity):
+        self.book_id = book_id
+        self.title = title
+        self.authors = authors
+        self.similarity = similarity
+
+    def __repr__(self):
+        return f"BookMatch({self.book_id}, {self.title!r}, {self.authors!r}, {self.similarity:.3f})"
+
+
+# Search hits, best first, as parallel arrays. The arrays are read-only so cached results can be shared
+class SearchResults:
+    __slots__ = ('book_ids', 'titles', 'authors', 'similarities')
+
+    def __init__(self, book_ids, titles, authors, similarities):
+        for name, values in zip(self.__slots__, (book_ids, titles, authors, similarities)):
+            values.flags.writeable = False
+            setattr(self, name, values)
+
+    def __len__(self):
+        return len(self.book_ids)
+
+    def __iter__(self):
+        return map(BookMatch, self.book_ids.tolist(), self.titles, self.authors, self.similarities.tolist())
+
+    def __getitem__(self, position):
+        return BookMatch(int(self.book_ids[position]), self.titles[position],
+                         self.authors[position], float(self.similarities[position]))
+
+    def __repr__(self):
+        return f"SearchResults({list(self)!r})"
+
+    # The best count results
+    def head(self, count):
+        return SearchResults(self.book_ids[:count], self.titles[:count], self.authors[:count], self.similarities[:count])
+
+    # The results as the table find_similar_books used to return
+    def to_frame(self):
+        return pd.DataFrame({
+            'Title': self.titles,
+            'Authors': self.authors,
+            'similarity': self.similarities,
+        }, index=self.book_ids)
+
+
+# Ranked search results handed out a page at a time. All matching books are scored up front,
+# but they are only sorted as far as they are read: the sorted prefix doubles whenever it runs out
+class ResultCursor(object):
+    def __init__(self, index, doc_ids, scores, page_size=CURSOR_PAGE_SIZE):
+        self.index = index
+        self.doc_ids = doc_ids
+        self.scores = scores
+        self.page_size = page_size
+        self.position = 0
+        self.ranked_ids = np.empty(0, dtype=np.int64)
+        self.ranked_scores = np.empty(0)
+
+    # Number of matching books
+    def __len__(self):
+        return len(self.doc_ids)
+
+    @property
+    def exhausted(self):
+        return self.position >= len(self.doc_ids)
+
+    # Makes sure the best count results are sorted
+    def rank(self, count):
+        if count <= len(self.ranked_ids) or len(self.ranked_ids) == len(self.doc_ids):
+            return
+        size = max(count, 2 * len(self.ranked_ids), self.page_size)
+        self.ranked_ids, self.ranked_scores = select_top_k(self.doc_ids, self.scores, size, -np.inf)
+
+    # The best count results, without moving the cursor
+    def head(self, count):
+        self.rank(count)
+        return self.index.results(self.ranked_ids[:count], self.ranked_scores[:count])
+
+    # The next count results (a page by default), empty once every result was read
+    def fetch(self, count=None):
+        end = min(self.position + (count or self.page_size), len(self.doc_ids))
+        self.rank(end)
+        page = self.index.results(self.ranked_ids[self.position:end], self.ranked_scores[self.position:end])
+        self.position = end
+        return page
+
+    # The remaining results one by one, fetched a page at a time
+    def __iter__(self):
+        while not self.exhausted:
+            yield from self.fetch()
+
+
+# Picks the top_n scores at or above min_similarity, best first (ties go to the lower book id)
+def select_top_k(doc_ids, scores, top_n, min_similarity):
+    if top_n <= 0:
+        return np.empty(0, dtype=np.int64), np.empty(0)
+
+    keep = np.flatnonzero(scores >= min_similarity)
+    doc_ids = keep if doc_ids is None else doc_ids[keep]
+    scores = scores[keep]
+
+    # Partition instead of sorting everything when there are more matches than we need
+    if len(scores) > top_n:
+        kth = np.partition(scores, len(scores) - top_n)[len(scores) - top_n]
+        better = np.flatnonzero(scores > kth)
+        ties = np.flatnonzero(scores == kth)[:top_n - len(better)]
+        winners = np.concatenate([better, ties])
+        doc_ids, scores = doc_ids[winners], scores[winners]
+
+    order = np.lexsort((doc_ids, -scores))
+    return doc_ids[order], scores[order]
+
+
+# Keeps the ids found in the sorted candidates array
+def in_candidates(doc_ids, candidates):
+    if len(candidates) == 0:
+        return np.zeros(len(doc_ids), dtype=bool)
+    positions = np.searchsorted(candidates, doc_ids)
+    positions[positions == len(candidates)] = 0
+    return candidates[positions] == doc_ids
+
+
+# Names that used to be module globals or functions of this module, now kept by the default engine
+ENGINE_NAMES = {
+    'current_index': 'index', 'index_lock': 'lock', 'result_cache': 'result_cache',
+    'query_vector_cache': 'query_vector_cache', 'get_categories': 'categories',
+    'get_index': 'get_index', 'set_index': 'set_index', 'transform_query': 'transform_query',
+    'find_similar_books': 'find_similar_books', 'find_similar_books_batch': 'find_similar_books_batch',
+    'similar_to_book': 'similar_to_book', 'cache_stats': 'cache_stats', 'add_books': 'add_books',
+    'add_book': 'add_book', 'update_book': 'update_book', 'remove_book': 'remove_book',
+    'schedule_compaction': 'schedule_compaction', 'compact_index': 'compact_index',
+}
+
+
+# The old module level names go to the default engine, and the old globals load the index when first read
+def __getattr__(name):
+    if name in ENGINE_NAMES:
+        return getattr(default_engine, ENGINE_NAMES[name])
+    if name in ('data', 'tfidf_vectorizer', 'tfidf_matrix'):
+        return getattr(default_engine.get_index(), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+# Scores the query against one index version and returns the top results table
+def rank_books(index, query_vector, top_n, min_similarity, category_filter, author_filter):
+    # Only the filtered books are considered for the top results
+    candidates = filter_stage(index, category_filter, author_filter)
+    if candidates is not None and len(candidates) == 0:
+        return index.results(candidates, np.empty(0))
+
+    with instrumentation.stage('score'):
+        if candidates is not None and (min_similarity <= 0 or
+                                       index.row_lengths[candidates].sum() < index.term_doc_counts[query_vector.indices].sum()):
+            # A small filtered subset is cheaper to score row by row than by walking the posting lists
+            doc_ids, scores = score_rows(index.tfidf_matrix, query_vector, top_n, min_similarity, candidates)
+            instrumentation.count('documents_scored', len(candidates))
+        elif min_similarity > 0:
+            doc_ids, similarity_scores = index.score_postings(query_vector, min_similarity, top_n, candidates)
+            instrumentation.count('documents_scored', len(doc_ids))
+            doc_ids, scores = select_top_k(doc_ids, similarity_scores, top_n, min_similarity)
+        else:
+            # At a zero threshold books sharing no terms qualify too, so every book is scored
+            doc_ids, scores = score_rows(index.tfidf_matrix, query_vector, top_n, min_similarity)
+            instrumentation.count('documents_scored', index.tfidf_matrix.shape[0])
+
+    with instrumentation.stage('results'):
+        return index.results(doc_ids, scores)
+
+
+# The filtered books, timed and counted
+def filter_stage(index, category_filter, author_filter):
+    with instrumentation.stage('filter'):
+        candidates = index.filter_candidates(category_filter, author_filter)
+    if candidates is not None:
+        instrumentation.count('candidates', len(candidates))
+    return candidates
+
+
+score_pool = None
+score_pool_size = 0
+score_pool_lock = threading.Lock()
+
+
+# Thread pool for the shards, recreated if SCORE_SHARDS was changed
+def get_score_pool():
+    global score_pool, score_pool_size
+    with score_pool_lock:
+        if score_pool is None or score_pool_size != SCORE_SHARDS:
+            if score_pool is not None:
+                score_pool.shutdown(wait=False)
+            score_pool = ThreadPoolExecutor(max_workers=SCORE_SHARDS, thread_name_prefix='score')
+            score_pool_size = SCORE_SHARDS
+        return score_pool
+
+
+# Top results among the rows doc_ids (every book when None). Large scans are split into row shards that
+# each keep their own top results, merged afterwards, which gives exactly the result of one serial pass
+def score_rows(tfidf_matrix, query_vector, top_n, min_similarity, doc_ids=None):
+    # Rows and query are unit length, so the dot product is the cosine similarity
+    query = query_vector.toarray().ravel()
+    n_rows = tfidf_matrix.shape[0] if doc_ids is None else len(doc_ids)
+    n_shards = max(1, min(SCORE_SHARDS, n_rows // SCORE_SHARD_ROWS))
+    if n_shards == 1:
+        return score_shard(tfidf_matrix, query, doc_ids, 0, n_rows, top_n, min_similarity)
+
+    bounds = np.linspace(0, n_rows, n_shards + 1).astype(np.int64)
+    shards = get_score_pool().map(score_shard, itertools.repeat(tfidf_matrix), itertools.repeat(query),
+                                  itertools.repeat(doc_ids), bounds[:-1], bounds[1:],
+                                  itertools.repeat(top_n), itertools.repeat(min_similarity))
+    return merge_top_k(list(shards), top_n)
+
+
+# Top results of the rows start to stop of doc_ids, or of the matrix itself when doc_ids is None
+def score_shard(tfidf_matrix, query, doc_ids, start, stop, top_n, min_similarity):
+    if doc_ids is None:
+        # A view of the shard's rows, the matrix arrays are not copied
+        indptr = tfidf_matrix.indptr
+        rows = sparse.csr_matrix((tfidf_matrix.data[indptr[start]:indptr[stop]],
+                                  tfidf_matrix.indices[indptr[start]:indptr[stop]],
+                                  indptr[start:stop + 1] - indptr[start]),
+                                 shape=(stop - start, tfidf_matrix.shape[1]), copy=False)
+        shard_ids = np.arange(start, stop)
+    else:
+        shard_ids = doc_ids[start:stop]
+        rows = tfidf_matrix[shard_ids]
+
+    return select_top_k(shard_ids, rows @ query, top_n, min_similarity)
+
+
+# k-way merge of per-shard results, each best first with ties going to the lower id
+def merge_top_k(shards, top_n):
+    merged = heapq.merge(*[zip(-scores, doc_ids) for doc_ids, scores in shards])
+    best = list(itertools.islice(merged, top_n))
+    return (np.array([doc_id for _, doc_id in best], dtype=np.int64),
+            np.array([-score for score, _ in best], dtype=np.float64))
+
+
+# Every book at or above min_similarity that passes the filters, unsorted, for a ResultCursor
+def matching_books(index, query_vector, min_similarity, category_filter, author_filter):
+    candidates = filter_stage(index, category_filter, author_filter)
+    if candidates is not None and len(candidates) == 0:
+        return candidates, np.empty(0)
+
+    with instrumentation.stage('score'):
+        if min_similarity > 0:
+            # Without a top_n the posting lists are only pruned by the threshold
+            doc_ids, scores = index.score_postings(query_vector, min_similarity, 0, candidates)
+        else:
+            rows = index.tfidf_matrix if candidates is None else index.tfidf_matrix[candidates]
+            scores = rows @ query_vector.toarray().ravel()
+            doc_ids = np.arange(len(scores)) if candidates is None else candidates
+        instrumentation.count('documents_scored', len(scores))
+
+        keep = scores >= min_similarity
+        return doc_ids[keep], scores[keep]
+
+
+# Approximate version of rank_books: the index proposes candidates from the closest lists,
+# which are then scored exactly so the similarities match the exact search
+def rank_books_ann(index, query_vector, top_n, min_similarity, category_filter, author_filter, nprobe):
+    candidates = filter_stage(index, category_filter, author_filter)
+    if candidates is not None and len(candidates) == 0:
+        return index.results(candidates, np.empty(0))
+
+    n_candidates = max(top_n * ANN_RERANK_FACTOR, ANN_MIN_RERANK)
+    with instrumentation.stage('ann_search'):
+        doc_ids = index.ann.search(query_vector, n_candidates, nprobe, candidates)
+
+    with instrumentation.stage('score'):
+        similarity_scores = (index.tfidf_matrix[doc_ids] @ query_vector.T).toarray().ravel()
+        doc_ids, scores = select_top_k(doc_ids, similarity_scores, top_n, min_similarity)
+    instrumentation.count('documents_scored', len(similarity_scores))
+
+    with instrumentation.stage('results'):
+        return index.results(doc_ids, scores)
+
+
+# Books most similar to a book of the catalog, read from the neighbour table (computed on the first call).
+# Books changed or added since the table was computed are in no row, so while there are any they are scored
+# together with the row's books. Books whose row cannot answer are scored against the whole catalog
+def rank_neighbours(index, book_id, top_n):
+    check_book_id(index, book_id)
+
+    table = index.neighbours
+    row = table.lookup(book_id, top_n)
+    if row is not None:
+        instrumentation.count('neighbour_table_hits')
+        doc_ids, scores = row
+        if not len(table.changed):
+            return index.results(doc_ids[:top_n], scores[:top_n])
+
+        # Rescored exactly, so the row's books and the changed ones compare on the same scores
+        with instrumentation.stage('score'):
+            doc_ids = np.concatenate([doc_ids, table.changed[table.changed != book_id]])
+            scores = (index.tfidf_matrix[doc_ids] @ index.tfidf_matrix[book_id].T).toarray().ravel()
+            instrumentation.count('documents_scored', len(scores))
+            doc_ids, scores = select_top_k(doc_ids, scores, top_n, np.nextafter(0, 1))
+        return index.results(doc_ids, scores)
+
+    with instrumentation.stage('score'):
+        similarity_scores = (index.tfidf_matrix @ index.tfidf_matrix[book_id].T).toarray().ravel()
+        similarity_scores[book_id] = 0
+        doc_ids, scores = select_top_k(None, similarity_scores, top_n, np.nextafter(0, 1))
+    instrumentation.count('documents_scored', len(similarity_scores))
+    return index.results(doc_ids, scores)
+
+
+# TF-IDF vectors of the queries. Words missing from the vocabulary, which the vectorizer would drop,
+# are searched as the nearby terms the expander finds for them instead
+def query_vectors(index, queries):
+    query_matrix = index.tfidf_vectorizer.transform(queries)
+    vocabulary = index.tfidf_vectorizer.vocabulary_
+
+    rows = None
+    for i, query in enumerate(queries):
+        words = index.analyzer(query)
+        if all(word in vocabulary for word in words):
+            continue
+
+        counts = {}
+        for word in words:
+            column = vocabulary.get(word)
+            if column is not None:
+                counts[column] = counts.get(column, 0) + 1
+                continue
+            expansion = index.expander.expand(word)
+            instrumentation.count('expanded_terms', len(expansion))
+            for column, weight in expansion:
+                counts[column] = counts.get(column, 0) + weight
+
+        if rows is None:
+            rows = [query_matrix[j] for j in range(len(queries))]
+        columns = np.array(sorted(counts), dtype=np.int64)
+        values = np.array([counts[column] for column in columns.tolist()]) * index.tfidf_vectorizer.idf_[columns]
+        rows[i] = normalize(sparse.csr_matrix((values, columns, [0, len(columns)]), shape=(1, query_matrix.shape[1])))
+
+    return query_matrix if rows is None else sparse.vstack(rows, format='csr')
+
+
+# Whole queries suggested for partly typed text: the text with its last word completed or corrected
+def suggest_queries(index, text, limit, build_spelling=True):
+    if not text.strip() or text[-1].isspace():
+        return []
+
+    last_word = text.split()[-1]
+    head = text[:len(text) - len(last_word)]
+    return [head + term for term in index.expander.completions(last_word.lower(), limit, build_spelling)
+            if term != last_word.lower()]
+
+
+# Scores many queries with one sparse multiply per chunk, returning one results table per query
+def rank_books_batch(index, queries, top_n, min_similarity, category_filter, author_filter, chunk_size=None):
+    if not queries:
+        return []
+
+    with instrumentation.stage('transform'):
+        query_matrix = query_vectors(index, queries)
+
+    # Filtering the rows first keeps every score block only as wide as the candidates
+    candidates = filter_stage(index, category_filter, author_filter)
+    doc_matrix = index.tfidf_matrix if candidates is None else index.tfidf_matrix[candidates]
+
+    # No book passes the filters, so there is nothing to score
+    if doc_matrix.shape[0] == 0:
+        return [index.results(candidates, np.empty(0)) for _ in queries]
+
+    if chunk_size is None:
+        chunk_size = max(1, BATCH_BLOCK_BYTES // (8 * max(doc_matrix.shape[0], 1)))
+
+    results = []
+    for start in range(0, len(queries), chunk_size):
+        # Rows are unit length, so the dot products are the cosines. Multiplying the matrix by the transposed
+        # queries (rather than the queries by the transposed matrix) never copies the matrix
+        with instrumentation.stage('score'):
+            block = (doc_matrix @ query_matrix[start:start + chunk_size].T).T.toarray()
+        instrumentation.count('documents_scored', block.shape[0] * block.shape[1])
+
+        with instrumentation.stage('results'):
+            for similarity_scores in block:
+                doc_ids, scores = select_top_k(candidates, similarity_scores, top_n, min_similarity)
+                results.append(index.results(doc_ids, scores))
+
+    return results
+
+
+# Cleans book fields (dicts keyed like the CSV columns) the same way as CSV rows
+def book_frame(books):
+    books = list(books)
+    for book in books:
+        unknown = set(book) - set(CSV_COLUMNS)
+        if unknown:
+            raise ValueError(f"Unknown book fields: {', '.join(sorted(unknown))}")
+
+    frame = pd.DataFrame(books, columns=CSV_COLUMNS).astype(object)
+    frame['Category'] = clean_categories(frame['Category'])
+    return frame
+
+
+# Builds the next index version: the rows of book_ids are replaced by frame (ids past the end are appended),
+# or emptied and marked deleted when removed. Vectors use the current vocabulary and idf, there is no refit.
+# The cost grows with the catalog, not with the change: the matrix is copied with the new rows in place, and
+# the posting lists (and other cached structures) are rebuilt by the first search on the new version.
+# At 15k books that first search takes about 18 ms instead of 1.5 ms, so changes are best made in batches
+def changed_index(index, book_ids, frame=None, removed=False):
+    vectorizer = index.tfidf_vectorizer
+    n_books = len(index.catalog)
+    n_terms = index.tfidf_matrix.shape[1]
+    book_ids = np.asarray(book_ids, dtype=np.int64)
+    n_added = int(np.count_nonzero(book_ids >= n_books))
+
+    catalog = index.catalog
+    new_terms = index.new_terms
+    if removed:
+        vectors = sparse.csr_matrix((len(book_ids), n_terms))
+    else:
+        text = catalog_text(frame)
+        vectors = vectorizer.transform(text)
+
+        # Words the vocabulary does not know yet only become searchable after a refit
+        analyzer = vectorizer.build_analyzer()
+        new_terms = new_terms | {token for document in text for token in analyzer(document)
+                                 if token not in vectorizer.vocabulary_}
+
+        catalog = catalog.with_rows(book_ids, frame)
+
+    # Take the replaced rows' terms out of the document frequencies and add the new ones
+    document_frequency = index.document_frequency.copy()
+    document_frequency -= np.bincount(index.tfidf_matrix[book_ids[book_ids < n_books]].indices, minlength=n_terms)
+    document_frequency += np.bincount(vectors.indices, minlength=n_terms)
+
+    # Row i of the new matrix is old row i, unless it was changed
+    order = np.arange(n_books + n_added)
+    order[book_ids] = n_books + np.arange(len(book_ids))
+    tfidf_matrix = sparse.vstack([index.tfidf_matrix, vectors], format='csr')[order]
+
+    deleted = np.concatenate([index.deleted, np.zeros(n_added, dtype=bool)])
+    deleted[book_ids] = removed
+
+    changed = SearchIndex(catalog, vectorizer, tfidf_matrix, deleted, document_frequency, new_terms)
+
+    # An approximate index that was already built is carried over with just the changed rows placed
+    if 'ann' in index.__dict__:
+        changed.ann = index.ann.with_rows(book_ids, vectors)
+
+    # The vocabulary only changes on a refit, so the expander (and its spelling index) carries over as well
+    if 'expander' in index.__dict__:
+        changed.expander = index.expander
+
+    # The neighbour table is kept too, with the changed books scored directly until a refit
+    if 'neighbours' in index.__dict__:
+        changed.neighbours = index.neighbours.with_changes(book_ids)
+    return changed
+
+
+def check_book_id(index, book_id):
+    if not 0 <= book_id < len(index.catalog) or index.deleted[book_id]:
+        raise KeyError(f"No book with id {book_id}")
+
+
+# The index with books added (dicts with Title, Authors, Description and Category), and their ids
+def added_index(index, books):
+    frame = book_frame(books)
+    book_ids = np.arange(len(index.catalog), len(index.catalog) + len(frame))
+    return changed_index(index, book_ids, frame), book_ids.tolist()
+
 
-# Creates the columns for similarity calculation
-data['text'] = data[['Title', 'Authors', 'Description', 'Category']].fillna('').agg(' '.join, axis=1)
+# The index with the given fields of a book replaced (Title, Authors, Description or Category)
+def updated_index(index, book_id, fields):
+    check_book_id(index, book_id)
 
-# Compute TF-IDF matrix
-tfidf_vectorizer = TfidfVectorizer(stop_words='english')
-tfidf_matrix = tfidf_vectorizer.fit_transform(data['text'])
+    book = index.catalog.book(book_id)
+    book.update(fields)
+    frame = book_frame([book])
 
+    # The stored category is already cleaned, only a new one goes through cleaning
+    if 'Category' not in fields:
+        frame['Category'] = index.catalog.book(book_id)['Category']
 
-def get_categories():
-    return sorted(data['Category'].unique().tolist())
+    return changed_index(index, [book_id], frame)
 
 
-def find_similar_books(query, top_n=10, min_similarity=0.3, category_filter=None, author_filter=None):
-    query_vector = tfidf_vectorizer.transform([query])
-    similarity_scores = cosine_similarity(query_vector, tfidf_matrix).flatten()
+def removed_index(index, book_id):
+    check_book_id(index, book_id)
+    return changed_index(index, [book_id], removed=True)
 
-    # Create DataFrame with similarities
-    results = data.copy()
-    results['similarity'] = similarity_scores
 
-    # Apply filters
-    if category_filter:
-        results = results[results['Category'] == category_filter]
+# Whether updates have moved the idf far enough from what the matrix uses, or added enough unknown words
+def needs_compaction(index):
+    return index.idf_drift() >= IDF_DRIFT_THRESHOLD or len(index.new_terms) >= NEW_TERMS_THRESHOLD
 
-    if author_filter:
-        results = results[results['Authors'].str.contains(author_filter, na=False, case=False)]
 
-    # Filter by minimum similarity
-    results = results[results['similarity'] >= min_similarity]
+# The index refitted over the live books, so new words become searchable and the idf is current.
+# directory is where files computed from the new matrix (like the neighbour table) are saved
+def compacted_index(index, directory=None):
+    live = ~index.deleted
 
-    # Sort and get top results
-    results = results.sort_values('similarity', ascending=False).head(top_n)
+    def chunk_text():
+        for start in range(0, len(index.catalog), CSV_CHUNK_ROWS):
+            text = catalog_text(index.catalog.frame(start, start + CSV_CHUNK_ROWS))
+            yield text.where(live[start:start + CSV_CHUNK_ROWS], '')
 
-    return results[['Title', 'Authors', 'similarity']]
+    tfidf_vectorizer, tfidf_matrix = fit_tfidf(chunk_text(), n_documents=index.n_documents)
+    return SearchIndex(index.catalog.repacked(), tfidf_vectorizer, tfidf_matrix, index.deleted, directory=directory)
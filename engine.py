@@ -0,0 +1,290 @@
+import json
+import os
+import threading
+
+import instrumentation
+from cache import LRUCache
+
+# Loading CSV file
+file_path = 'data/BooksDataset.csv'
+
+# Folder where the fitted index is saved so a restart does not have to refit it
+index_dir = 'data/index'
+
+# Small file next to the index with the category names, read without loading the index
+CATEGORIES_FILE = 'categories.json'
+
+# Bounds of the search caches, entries expire after RESULT_CACHE_TTL seconds
+RESULT_CACHE_SIZE = 256
+QUERY_VECTOR_CACHE_SIZE = 1024
+RESULT_CACHE_TTL = 600
+
+# Match sets of search cursors are only cached up to this many books (16 bytes each), so a full
+# result cache holds at most about 40 MB of them however large the catalog is
+CURSOR_CACHE_MATCHES = 10000
+
+# Most suggestions offered for a partly typed query
+SUGGESTIONS = 8
+
+
+# Identifies the CSV the categories sidecar was written for
+def csv_stamp(csv_path):
+    stat = os.stat(csv_path)
+    return {'csv': os.path.abspath(csv_path), 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+# Lowercased with single spaces, so trivially different spellings of a query share cache entries
+def normalize_query(query):
+    return ' '.join(query.lower().split())
+
+
+# Identifies a search in the result cache
+def result_key(index, normalized_query, top_n, min_similarity, category_filter, author_filter, mode, nprobe):
+    return (index.version, normalized_query, category_filter or None, author_filter.lower() if author_filter else None,
+            float(min_similarity), int(top_n), mode, int(nprobe) if mode == 'ann' else None)
+
+
+# The search engine over one catalog. Nothing is loaded until the first search (or get_index) needs the
+# index, and pandas and scikit-learn are only imported then, so creating an engine is instant.
+# Searches read the current index once and use that snapshot throughout, updates replace it
+# while holding the lock so only one update runs at a time
+class SearchEngine(object):
+    def __init__(self, csv_path=file_path, directory=index_dir):
+        self.csv_path = csv_path
+        self.directory = directory
+        self.index = None
+        self.lock = threading.RLock()
+        self.compaction_thread = None
+
+        # Recent search results and query vectors
+        self.result_cache = LRUCache(maxsize=RESULT_CACHE_SIZE, ttl=RESULT_CACHE_TTL)
+        self.query_vector_cache = LRUCache(maxsize=QUERY_VECTOR_CACHE_SIZE, ttl=RESULT_CACHE_TTL)
+
+    # Publishes a new version of the index
+    def set_index(self, index):
+        self.index = index
+
+        # Entries for older versions can no longer be hit, so free them
+        self.result_cache.clear()
+        self.query_vector_cache.clear()
+
+    # Returns the current index, loading (or building) it the first time it is needed
+    def get_index(self):
+        index = self.index
+        if index is None:
+            with self.lock:
+                if self.index is None:
+                    import data
+                    self.set_index(data.SearchIndex(*data.load_index(self.csv_path, self.directory),
+                                                    directory=self.directory))
+                    self.save_categories()
+
+                    # Built here rather than on the first suggestion, which may be asked from a UI thread
+                    self.index.expander
+                index = self.index
+        return index
+
+    # Loads the index now instead of on the first search, and returns the categories
+    def preload(self):
+        self.get_index()
+        return self.categories()
+
+    def categories(self):
+        if self.index is None:
+            categories = self.saved_categories()
+            if categories is not None:
+                return categories
+        return sorted(self.get_index().category_ids)
+
+    # The categories written next to the index for this CSV, or None when there are none yet
+    def saved_categories(self):
+        try:
+            with open(os.path.join(self.directory, CATEGORIES_FILE), encoding='utf-8') as f:
+                saved = json.load(f)
+            if saved.pop('categories_of') == csv_stamp(self.csv_path):
+                return saved['categories']
+        except (OSError, ValueError, KeyError):
+            pass
+        return None
+
+    def save_categories(self):
+        try:
+            categories = {'categories_of': csv_stamp(self.csv_path), 'categories': sorted(self.index.category_ids)}
+            os.makedirs(self.directory, exist_ok=True)
+            with open(os.path.join(self.directory, CATEGORIES_FILE), 'w', encoding='utf-8') as f:
+                json.dump(categories, f)
+        except OSError:
+            # Without the sidecar the next start just waits for the index to fill the categories
+            pass
+
+    # Vectorizes a normalized query, with unknown words expanded to nearby terms,
+    # reusing the vector from an earlier search on the same index version
+    def transform_query(self, index, normalized_query):
+        key = (index.version, normalized_query)
+        query_vector = self.query_vector_cache.get(key)
+        if query_vector is None:
+            import data
+            with instrumentation.stage('transform'):
+                query_vector = data.query_vectors(index, [normalized_query])
+            self.query_vector_cache.put(key, query_vector)
+        else:
+            instrumentation.count('query_vector_cache_hits')
+        return query_vector
+
+    # mode='ann' trades exactness for speed on large catalogs: only the candidates found by the approximate
+    # index are scored, and nprobe sets how many of its lists are searched (more is slower but finds more)
+    def find_similar_books(self, query, top_n=10, min_similarity=0.3, category_filter=None, author_filter=None,
+                           mode='exact', nprobe=None):
+        if mode not in ('exact', 'ann'):
+            raise ValueError(f"Unknown search mode: {mode}")
+
+        with instrumentation.stage('search'):
+            index = self.get_index()
+            import data
+            if nprobe is None:
+                from ann import ANN_NPROBE
+                nprobe = ANN_NPROBE
+            normalized_query = normalize_query(query)
+
+            # Repeated searches are answered from the cache, which only ever holds results for the current index
+            key = result_key(index, normalized_query, top_n, min_similarity, category_filter, author_filter,
+                             mode, nprobe)
+            results = self.result_cache.get(key)
+            if results is None:
+                query_vector = self.transform_query(index, normalized_query)
+                if mode == 'ann':
+                    results = data.rank_books_ann(index, query_vector, top_n, min_similarity,
+                                                  category_filter, author_filter, nprobe)
+                else:
+                    results = data.rank_books(index, query_vector, top_n, min_similarity, category_filter, author_filter)
+                self.result_cache.put(key, results)
+            else:
+                instrumentation.count('result_cache_hits')
+
+        return results
+
+    # The results of an earlier find_similar_books call with the same arguments, or None.
+    # Never loads the index, so it can be asked from an event loop
+    def cached_results(self, query, top_n=10, min_similarity=0.3, category_filter=None, author_filter=None,
+                       mode='exact', nprobe=None):
+        index = self.index
+        if index is None:
+            return None
+        if nprobe is None:
+            from ann import ANN_NPROBE
+            nprobe = ANN_NPROBE
+        return self.result_cache.get(result_key(index, normalize_query(query), top_n, min_similarity,
+                                                category_filter, author_filter, mode, nprobe))
+
+    # All results of a search, ranked, as a cursor that sorts and hands them out a page at a time
+    def search_cursor(self, query, min_similarity=0.3, category_filter=None, author_filter=None, page_size=None):
+        with instrumentation.stage('search'):
+            index = self.get_index()
+            import data
+            normalized_query = normalize_query(query)
+
+            # The matches of a search are cached (under mode 'cursor') and every cursor reads them from the start.
+            # Larger match sets are scored again by every cursor
+            key = result_key(index, normalized_query, 0, min_similarity, category_filter, author_filter, 'cursor', None)
+            matches = self.result_cache.get(key)
+            if matches is None:
+                query_vector = self.transform_query(index, normalized_query)
+                matches = data.matching_books(index, query_vector, min_similarity, category_filter, author_filter)
+                if len(matches[0]) <= CURSOR_CACHE_MATCHES:
+                    for values in matches:
+                        values.flags.writeable = False
+                    self.result_cache.put(key, matches)
+            else:
+                instrumentation.count('result_cache_hits')
+            return data.ResultCursor(index, *matches, page_size or data.CURSOR_PAGE_SIZE)
+
+    # Scores many queries together, returning one results table per query
+    def find_similar_books_batch(self, queries, top_n=10, min_similarity=0.3, category_filter=None,
+                                 author_filter=None, chunk_size=None):
+        with instrumentation.stage('batch_search'):
+            index = self.get_index()
+            import data
+            return data.rank_books_batch(index, list(queries), top_n, min_similarity,
+                                         category_filter, author_filter, chunk_size)
+
+    # Loads or builds (and saves) the neighbour table of the current index now, so the first similar_to_book
+    # does not wait for it. The table compares every book with every other, see neighbours.py
+    def build_neighbours(self):
+        self.get_index().neighbours
+
+    # Books most similar to a book of the catalog
+    def similar_to_book(self, book_id, top_n=10):
+        with instrumentation.stage('similar_to_book'):
+            index = self.get_index()
+            import data
+            return data.rank_neighbours(index, book_id, top_n)
+
+    # Queries completing or correcting the last word of partly typed text, most common words first.
+    # quick skips the corrections until a search has built the spelling index. The expander itself is
+    # built with the index, so a quick lookup stays well under a millisecond and can run on a UI thread
+    def suggest(self, text, limit=SUGGESTIONS, quick=False):
+        index = self.get_index()
+        import data
+        return data.suggest_queries(index, text, limit, build_spelling=not quick)
+
+    # Hit and miss counters of the search caches
+    def cache_stats(self):
+        return {'results': self.result_cache.stats(), 'query_vectors': self.query_vector_cache.stats()}
+
+    # Adds books (dicts with Title, Authors, Description and Category) and returns their ids.
+    # Every call costs a copy of the matrix plus a rebuild of the posting lists on the next search
+    # (see changed_index), so adding many books in one call is much cheaper than one call per book
+    def add_books(self, books):
+        import data
+        with self.lock:
+            index, book_ids = data.added_index(self.get_index(), books)
+            self.set_index(index)
+        self.schedule_compaction()
+        return book_ids
+
+    def add_book(self, title, authors=None, description=None, category=None):
+        return self.add_books([{'Title': title, 'Authors': authors, 'Description': description, 'Category': category}])[0]
+
+    # Replaces the given fields of a book (Title, Authors, Description or Category), keeping its id
+    def update_book(self, book_id, **fields):
+        import data
+        with self.lock:
+            self.set_index(data.updated_index(self.get_index(), book_id, fields))
+        self.schedule_compaction()
+
+    def remove_book(self, book_id):
+        import data
+        with self.lock:
+            self.set_index(data.removed_index(self.get_index(), book_id))
+        self.schedule_compaction()
+
+    # Starts a background refit once the updates have moved the idf far enough from what the matrix uses
+    def schedule_compaction(self):
+        import data
+        if not data.needs_compaction(self.index):
+            return
+
+        with self.lock:
+            if self.compaction_thread is None or not self.compaction_thread.is_alive():
+                self.compaction_thread = threading.Thread(target=self.compact_index, daemon=True)
+                self.compaction_thread.start()
+
+    # Refits the TF-IDF model over the live books so new words become searchable and the idf is current.
+    # The refit runs without the lock, so searches and updates carry on meanwhile. It is only published
+    # if no update landed during it, otherwise it would drop that update, and the refit starts over
+    def compact_index(self):
+        import data
+        while True:
+            index = self.get_index()
+            compacted = data.compacted_index(index, self.directory)
+
+            # Like on load, the expander is ready before the index is published
+            compacted.expander
+            with self.lock:
+                if self.index is index:
+                    self.set_index(compacted)
+                    break
+
+
+# The engine the GUI, the service and the module level functions of data.py use
+default_engine = SearchEngine()
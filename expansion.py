@@ -0,0 +1,156 @@
+from bisect import bisect_left
+
+import numpy as np
+
+from cache import LRUCache
+
+# An unknown word is replaced by at most this many vocabulary terms
+EXPANSION_TERMS = 5
+
+# Words shorter than this are not spell corrected, shorter prefixes are not completed
+SPELLING_MIN_LENGTH = 4
+PREFIX_MIN_LENGTH = 3
+
+# How much a one edit correction counts against a completion when an unknown word's weight is split
+CORRECTION_WEIGHT = 1.0
+COMPLETION_WEIGHT = 0.5
+
+# Expansions remembered per token
+EXPANSION_CACHE_SIZE = 4096
+
+# Prefixes of more than COMPLETION_RANGE terms have their COMPLETIONS_KEPT most frequent completions
+# worked out up front, so completing a short prefix never sorts a large part of the vocabulary
+COMPLETION_RANGE = 256
+COMPLETIONS_KEPT = 32
+
+
+# Whether a and b differ by at most one inserted, deleted or substituted letter, or two swapped neighbours
+def within_one_edit(a, b):
+    if abs(len(a) - len(b)) > 1:
+        return False
+
+    start = 0
+    while start < min(len(a), len(b)) and a[start] == b[start]:
+        start += 1
+    end_a, end_b = len(a), len(b)
+    while end_a > start and end_b > start and a[end_a - 1] == b[end_b - 1]:
+        end_a -= 1
+        end_b -= 1
+
+    if end_a - start <= 1 and end_b - start <= 1:
+        return True
+    return end_a - start == 2 and end_b - start == 2 and a[start] == b[start + 1] and a[start + 1] == b[start]
+
+
+# The word with each one of its letters left out
+def deletes(word):
+    return {word[:i] + word[i + 1:] for i in range(len(word))}
+
+
+# Finds vocabulary terms near words the vocabulary does not know: completions of a prefix by binary search
+# in the sorted terms, and one edit corrections through a symmetric delete index (a term and a word are
+# one edit apart only if they share the word, the term or one of their single letter deletes)
+class QueryExpander:
+    def __init__(self, terms, document_frequency):
+        # Columns are numbered in sorted term order, so the terms are already sorted
+        self.terms = terms
+        self.document_frequency = np.asarray(document_frequency)
+        self.cache = LRUCache(maxsize=EXPANSION_CACHE_SIZE)
+        self.delete_hashes = None
+        self.delete_terms = None
+        self.build_common_completions()
+
+    # Goes down the prefixes letter by letter, only into those with more than COMPLETION_RANGE terms.
+    # Each level looks at every term at most once
+    def build_common_completions(self):
+        self.common_completions = {}
+        crowded = ['']
+        while crowded:
+            prefix = crowded.pop()
+            start, stop = self.prefix_range(prefix)
+            for longer in {term[:len(prefix) + 1] for term in self.terms[start:stop]} - {prefix}:
+                longer_start, longer_stop = self.prefix_range(longer)
+                if longer_stop - longer_start > COMPLETION_RANGE:
+                    self.common_completions[longer] = self.most_frequent(np.arange(longer_start, longer_stop),
+                                                                         COMPLETIONS_KEPT)
+                    crowded.append(longer)
+
+    # Builds the delete index on the first spelling correction: sorted hashes of every term and its
+    # deletes, each pointing back at the term. Hash collisions are weeded out by within_one_edit
+    def build_deletes(self):
+        hashes = []
+        owners = []
+        for term_id, term in enumerate(self.terms):
+            if len(term) < SPELLING_MIN_LENGTH - 1:
+                continue
+            for variant in deletes(term) | {term}:
+                hashes.append(hash(variant))
+                owners.append(term_id)
+
+        hashes = np.array(hashes, dtype=np.int64)
+        order = np.argsort(hashes, kind='stable')
+        self.delete_terms = np.array(owners, dtype=np.int64)[order]
+        self.delete_hashes = hashes[order]
+
+    # Ids of the terms starting with prefix
+    def prefix_range(self, prefix):
+        return bisect_left(self.terms, prefix), bisect_left(self.terms, prefix + '\U0010ffff')
+
+    # Ids of the terms one edit away from word
+    def corrections(self, word):
+        if len(word) < SPELLING_MIN_LENGTH:
+            return np.empty(0, dtype=np.int64)
+        if self.delete_hashes is None:
+            self.build_deletes()
+
+        variants = np.array([hash(variant) for variant in deletes(word) | {word}], dtype=np.int64)
+        starts = np.searchsorted(self.delete_hashes, variants, side='left')
+        stops = np.searchsorted(self.delete_hashes, variants, side='right')
+        candidates = np.unique(np.concatenate([self.delete_terms[start:stop] for start, stop in zip(starts, stops)]))
+        return np.array([term_id for term_id in candidates.tolist()
+                         if self.terms[term_id] != word and within_one_edit(self.terms[term_id], word)], dtype=np.int64)
+
+    # The most frequent of the given terms, most frequent first (ties go to the lower id)
+    def most_frequent(self, term_ids, limit):
+        term_ids = np.asarray(term_ids, dtype=np.int64)
+        order = np.lexsort((term_ids, -self.document_frequency[term_ids]))
+        return term_ids[order[:limit]]
+
+    # Ids of the most frequent terms starting with prefix, most frequent first
+    def most_frequent_completions(self, prefix, limit):
+        common = self.common_completions.get(prefix)
+        if common is not None and limit <= len(common):
+            return common[:limit]
+        start, stop = self.prefix_range(prefix)
+        return self.most_frequent(np.arange(start, stop), limit)
+
+    # Terms a partly typed word may become, most frequent first, then corrections of it.
+    # Without build_spelling corrections are only added once the delete index has been built
+    def completions(self, prefix, limit, build_spelling=True):
+        term_ids = self.most_frequent_completions(prefix, limit)
+        if len(term_ids) < limit and (build_spelling or self.delete_hashes is not None):
+            corrections = self.most_frequent(self.corrections(prefix), limit - len(term_ids))
+            term_ids = np.concatenate([term_ids, corrections])
+        return [self.terms[term_id] for term_id in term_ids.tolist()]
+
+    # Weighted terms to search for in place of an unknown word: (term id, weight) pairs whose weights add up
+    # to one, split by how often each term occurs with corrections counting more than completions
+    def expand(self, word):
+        expansion = self.cache.get(word)
+        if expansion is not None:
+            return expansion
+
+        kind_weights = {}
+        if len(word) >= PREFIX_MIN_LENGTH:
+            kind_weights.update((term_id, COMPLETION_WEIGHT)
+                                for term_id in self.most_frequent_completions(word, EXPANSION_TERMS).tolist())
+        kind_weights.update((term_id, CORRECTION_WEIGHT)
+                            for term_id in self.most_frequent(self.corrections(word), EXPANSION_TERMS).tolist())
+
+        scores = {term_id: weight * (self.document_frequency[term_id] + 1) for term_id, weight in kind_weights.items()}
+        best = sorted(scores, key=lambda term_id: (-scores[term_id], term_id))[:EXPANSION_TERMS]
+        total = sum(scores[term_id] for term_id in best)
+        expansion = [(term_id, float(scores[term_id] / total)) for term_id in best]
+
+        self.cache.put(word, expansion)
+        return expansion
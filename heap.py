@@ -1,7 +1,7 @@
 import tkinter as tk
 from tkinter import Toplevel
 import heapq
-import time
+from collections import deque
 
 # This handles hover interactions
 class ToolTip(object):
@@ -43,57 +43,273 @@ def CreateToolTip(widget, node, text, x, y):
     widget.tag_bind(node, '<Enter>', enter)
     widget.tag_bind(node, '<Leave>', leave)
 
-# Creates a max heap from the similar books data
+# A heap list of (-similarity, title) that also remembers how many nodes BFS and DFS visit
+# before reaching each title, so a node click is a lookup instead of two searches.
+# The counts are computed once, call reindex() after changing the heap
+class IndexedHeap(list):
+    def __init__(self, items=()):
+        super().__init__(items)
+        self.reindex()
+
+    def reindex(self):
+        node_count = len(self)
+
+        # Position of every index in a left-first preorder walk
+        dfs_rank = [0] * node_count
+        rank = 0
+        stack = [0]
+        while stack:
+            index = stack.pop()
+            if index >= node_count:
+                continue
+            rank += 1
+            dfs_rank[index] = rank
+            stack.append(2 * index + 2)
+            stack.append(2 * index + 1)
+
+        # A repeated title is found at its first occurrence in each order
+        self.bfs_counts = {}
+        self.dfs_counts = {}
+        for index, (similarity, title) in enumerate(self):
+            self.bfs_counts.setdefault(title, index + 1)
+            self.dfs_counts[title] = min(self.dfs_counts.get(title, node_count), dfs_rank[index])
+
+    # Nodes visited until the title is found, or every node when it is not in the heap
+    def bfs_visits(self, title):
+        return self.bfs_counts.get(title, len(self))
+
+    def dfs_visits(self, title):
+        return self.dfs_counts.get(title, len(self))
+
+
+# Creates a max heap from the similar books data in one heapify over the negated scores.
+# Equal scores are ordered by book id (titles can be missing, and None does not compare with a title),
+# then the heap keeps each node's score and title
 def create_max_heap(similar_books):
-    max_heap = []
-    for _, row in similar_books.iterrows():
-        heapq.heappush(max_heap, (-row['similarity'], row['Title']))
-    return max_heap
-
-# draws the heap from the search button
-def draw_heap(canvas_widget, heap, x, y, index=0, level=0, max_levels=5, node_size=20, color="orange"):
-    if index >= len(heap) or level >= max_levels:
-        return
-
-    similarity, title = heap[index]
-    similarity = -similarity
-    node_text = f"{title}\n({similarity:.2f})"
-
-    # This Calculates spacing
-    total_width = (2 ** max_levels) * node_size
-    horizontal_spacing = total_width / (2 ** (level + 1))
+    titles = similar_books.titles
+    keys = list(zip((-similarity for similarity in similar_books.similarities.tolist()),
+                    similar_books.book_ids.tolist(), range(len(titles))))
+    heapq.heapify(keys)
+    return IndexedHeap((similarity, titles[position]) for similarity, _, position in keys)
+
+# Levels a heap is drawn with when none are given: all of them, up to this many
+MAX_DRAWN_LEVELS = 10
+
+
+# Levels of a heap with node_count nodes
+def heap_depth(node_count):
+    return node_count.bit_length()
+
+
+# Number of nodes in the subtree under index, counted level by level
+def subtree_size(index, node_count):
+    size = 0
+    first = last = index
+    while first < node_count:
+        size += min(last, node_count - 1) - first + 1
+        first, last = 2 * first + 1, 2 * last + 2
+    return size
+
+
+# Draws heaps on a canvas by reusing a pool of canvas items instead of creating new items and
+# Button widgets on every search. Only nodes inside the visible part of the canvas are drawn,
+# and the levels past max_levels are collapsed into one summary box per subtree
+class HeapRenderer(object):
+    def __init__(self, canvas_widget):
+        self.canvas = canvas_widget
+        self.heap = []
+        self.positions = {}
+        self.summaries = []
+        self.node_size = 20
+        self.color = "orange"
+
+        # Pooled item ids by kind, and the heap index every pooled node item currently shows
+        self.pool = {}
+        self.item_index = {}
+        self.tooltip = ToolTip(canvas_widget)
+        canvas_widget.bind("<Configure>", lambda event: self.render(), add="+")
+
+    # Without max_levels every level of the heap is laid out, up to MAX_DRAWN_LEVELS, so a large heap
+    # is much wider than the canvas and only the part scrolled into view is drawn
+    def draw(self, heap, x, y, max_levels=None, node_size=20, color="orange"):
+        if max_levels is None:
+            max_levels = min(heap_depth(len(heap)), MAX_DRAWN_LEVELS)
+        self.heap = heap
+        self.node_size = node_size
+        self.color = color
+        self.positions = heap_layout(heap, x, y, max_levels, node_size)
+
+        # Nodes on the last drawn level that still have children get a summary box below them
+        self.summaries = [(index, node_x, node_y + 80, subtree_size(index, len(heap)) - 1)
+                          for index, (node_x, node_y) in self.positions.items()
+                          if 2 * index + 1 < len(heap) and 2 * index + 1 not in self.positions]
+
+        # Let the scrollbars reach every node
+        if self.positions:
+            points = list(self.positions.values()) + [(node_x, node_y) for _, node_x, node_y, _ in self.summaries]
+            xs = [point[0] for point in points]
+            ys = [point[1] for point in points]
+            margin = node_size * 3
+            self.canvas.configure(scrollregion=(min(min(xs) - margin, 0), 0, max(xs) + margin, max(ys) + margin))
+        self.render()
+
+    # Hides the heap, keeping the pooled items for the next draw
+    def clear(self):
+        self.heap = []
+        self.positions = {}
+        self.summaries = []
+        self.render()
+
+    # Scrollbar commands, the newly visible nodes are drawn after scrolling
+    def xview(self, *args):
+        self.canvas.xview(*args)
+        self.render()
+
+    def yview(self, *args):
+        self.canvas.yview(*args)
+        self.render()
+
+    # Area of the canvas currently on screen, widened by a node so edges crossing the border are kept.
+    # A canvas that is not mapped yet reports a size of 1, the size it asked for is used instead
+    def visible_area(self):
+        margin = self.node_size * 2
+        left = self.canvas.canvasx(0) - margin
+        top = self.canvas.canvasy(0) - margin
+        width = self.canvas.winfo_width() if self.canvas.winfo_ismapped() else self.canvas.winfo_reqwidth()
+        height = self.canvas.winfo_height() if self.canvas.winfo_ismapped() else self.canvas.winfo_reqheight()
+        return left, top, left + width + 2 * margin, top + height + 2 * margin
+
+    # Returns a pooled item of the given kind, creating one when the pool is used up.
+    # Every item gets its event bindings once, when it is created
+    def take(self, kind, used):
+        items = self.pool.setdefault(kind, [])
+        if used[kind] == len(items):
+            if kind == "line":
+                item = self.canvas.create_line(0, 0, 0, 0, width=2, fill="black", tags=("heap_item",))
+            elif kind == "oval":
+                item = self.canvas.create_oval(0, 0, 0, 0, outline="black", tags=("heap_item", "heap_node"))
+            elif kind == "button":
+                item = self.canvas.create_rectangle(0, 0, 0, 0, fill="#e8e8e8", outline="#a0a0a0",
+                                                    tags=("heap_item", "heap_node"))
+            elif kind == "summary":
+                item = self.canvas.create_rectangle(0, 0, 0, 0, fill="#f4f4f4", outline="#808080", dash=(3, 2),
+                                                    tags=("heap_item", "heap_summary"))
+            else:
+                item = self.canvas.create_text(0, 0, text="", font=("Helvetica", 8),
+                                               tags=("heap_item", "heap_summary" if kind == "summary_text" else "heap_node"))
+
+            if kind in ("oval", "button", "label"):
+                self.canvas.tag_bind(item, "<Button-1>", self.click)
+            if kind != "line":
+                self.canvas.tag_bind(item, "<Enter>", self.enter)
+                self.canvas.tag_bind(item, "<Leave>", lambda event: self.tooltip.hidetip())
+            items.append(item)
+
+        item = items[used[kind]]
+        used[kind] += 1
+        return item
+
+    # Moves pooled items onto the visible nodes and hides the rest
+    def render(self):
+        # Pooled items are gone if someone cleared the canvas
+        if self.pool and not self.canvas.find_withtag("heap_item"):
+            self.pool = {}
+        self.item_index = {}
+
+        used = {kind: 0 for kind in ("line", "oval", "button", "label", "summary", "summary_text")}
+        left, top, right, bottom = self.visible_area()
+        size = self.node_size
+
+        def visible(node_x, node_y):
+            return left <= node_x <= right and top <= node_y <= bottom
+
+        for index, (node_x, node_y) in self.positions.items():
+            parent = (index - 1) // 2
+            parent_position = self.positions.get(parent) if index > 0 else None
+
+            # Edges are drawn when either end is on screen
+            if parent_position and (visible(node_x, node_y) or visible(*parent_position)):
+                line = self.take("line", used)
+                self.canvas.coords(line, parent_position[0], parent_position[1] + size, node_x, node_y - size)
+                self.canvas.itemconfigure(line, state="normal")
+
+            if not visible(node_x, node_y):
+                continue
+
+            oval = self.take("oval", used)
+            self.canvas.coords(oval, node_x - size, node_y - size, node_x + size, node_y + size)
+            self.canvas.itemconfigure(oval, fill=self.color, state="normal")
+
+            # A clickable label below the node replaces the old Button widget
+            button = self.take("button", used)
+            self.canvas.coords(button, node_x - 25, node_y + size + 3, node_x + 25, node_y + size + 17)
+            self.canvas.itemconfigure(button, state="normal")
+            label = self.take("label", used)
+            self.canvas.coords(label, node_x, node_y + size + 10)
+            self.canvas.itemconfigure(label, text=f"Node {index}", state="normal")
+
+            for item in (oval, button, label):
+                self.item_index[item] = index
+
+        for index, node_x, node_y, hidden_count in self.summaries:
+            if not visible(node_x, node_y):
+                continue
+
+            parent_x, parent_y = self.positions[index]
+            line = self.take("line", used)
+            self.canvas.coords(line, parent_x, parent_y + size + 17, node_x, node_y - 12)
+            self.canvas.itemconfigure(line, state="normal")
+
+            box = self.take("summary", used)
+            self.canvas.coords(box, node_x - 30, node_y - 12, node_x + 30, node_y + 12)
+            self.canvas.itemconfigure(box, state="normal")
+            text = self.take("summary_text", used)
+            self.canvas.coords(text, node_x, node_y)
+            self.canvas.itemconfigure(text, text=f"+{hidden_count} more", state="normal")
+
+            self.item_index[box] = index
+            self.item_index[text] = index
+
+        # Hide the pooled items this frame did not need
+        for kind, items in self.pool.items():
+            for item in items[used[kind]:]:
+                self.canvas.itemconfigure(item, state="hidden")
+
+        # Nodes and boxes stay above the edges
+        self.canvas.tag_raise("heap_node")
+        self.canvas.tag_raise("heap_summary")
+
+    def click(self, event):
+        index = self.current_index()
+        if index is not None:
+            node_button_click(self.canvas, index, self.heap)
+
+    # Shows the node info, or what a summary box stands for
+    def enter(self, event):
+        index = self.current_index()
+        if index is None:
+            return
 
-    # Draw the node
-    canvas_widget.create_oval(
-        x - node_size, y - node_size, x + node_size, y + node_size,
-        fill=color, outline="black", tags=f"node_{index}"
-    )
+        similarity, title = self.heap[index]
+        if "heap_summary" in self.canvas.gettags("current"):
+            text = f"{subtree_size(index, len(self.heap)) - 1} more books below\n{title}"
+        else:
+            text = f"{title}\n({-similarity:.2f})"
+        self.tooltip.hidetip()
+        self.tooltip.showtip(text, event.x, event.y)
 
-    # Creates the tooltip for the node
-    CreateToolTip(canvas_widget, f"node_{index}", node_text, x, y)
+    def current_index(self):
+        items = self.canvas.find_withtag("current")
+        return self.item_index.get(items[0]) if items else None
 
-    # Creates a button for the bfs/dfs search feature and places the button with the index below the node
-    node_button = tk.Button(canvas_widget, text=f"Node {index}", command=lambda idx=index: node_button_click(canvas_widget, index, heap))
-    canvas_widget.create_window(x, y + node_size + 10, window=node_button)
 
-    # Draw child nodes
-    vertical_spacing = 80
-    left_child_index = 2 * index + 1
-    right_child_index = 2 * index + 2
-
-    # Left child
-    if left_child_index < len(heap):
-        child_x = x - horizontal_spacing
-        child_y = y + vertical_spacing
-        canvas_widget.create_line(x, y + node_size, child_x, child_y - node_size, width=2, fill="black")
-        draw_heap(canvas_widget, heap, child_x, child_y, left_child_index, level + 1, max_levels, node_size, color)
-
-    # Right child
-    if right_child_index < len(heap):
-        child_x = x + horizontal_spacing
-        child_y = y + vertical_spacing
-        canvas_widget.create_line(x, y + node_size, child_x, child_y - node_size, width=2, fill="black")
-        draw_heap(canvas_widget, heap, child_x, child_y, right_child_index, level + 1, max_levels, node_size, color)
+# draws the heap from the search button, reusing one renderer per canvas
+def draw_heap(canvas_widget, heap, x, y, max_levels=None, node_size=20, color="orange"):
+    renderer = getattr(canvas_widget, "heap_renderer", None)
+    if renderer is None:
+        renderer = canvas_widget.heap_renderer = HeapRenderer(canvas_widget)
+    renderer.draw(heap, x, y, max_levels, node_size, color)
+    return renderer
 
 # Button clicked feature
 def node_button_click(canvas, index, heap):
@@ -101,8 +317,12 @@ def node_button_click(canvas, index, heap):
     #print(f"Node {index} clicked!")
 
     # receives the number of traversed nodes
-    BFS_number_of_visited_nodes = bfs_search(heap, title)
-    DFS_number_of_visited_nodes = dfs_search(heap, title)
+    if isinstance(heap, IndexedHeap):
+        BFS_number_of_visited_nodes = heap.bfs_visits(title)
+        DFS_number_of_visited_nodes = heap.dfs_visits(title)
+    else:
+        BFS_number_of_visited_nodes = bfs_search(heap, title)
+        DFS_number_of_visited_nodes = dfs_search(heap, title)
 
     #print(f"BFS nodes visited: {BFS_number_of_visited_nodes}")
     #print(f"DFS nodes visited: {DFS_visited}")
@@ -110,12 +330,12 @@ def node_button_click(canvas, index, heap):
     canvas.delete("text")
     canvas_width = canvas.winfo_width()
 
-    # Creates space between the edge of the canvas and the shown text
+    # Creates space between the edge of the canvas and the shown text, wherever the canvas is scrolled to
     space_x = 20
     space_y = 15
-    x_position = canvas_width - space_x
-    y_position_bfs = space_y
-    y_position_dfs = space_y + 20
+    x_position = canvas.canvasx(canvas_width) - space_x
+    y_position_bfs = canvas.canvasy(0) + space_y
+    y_position_dfs = y_position_bfs + 20
 
     # set tag to text to delete and anchor to 'e' to move it all the way to the right
     canvas.create_text(x_position, y_position_bfs,
@@ -133,123 +353,175 @@ def node_button_click(canvas, index, heap):
 
 # BFS search
 def bfs_search(heap, target):
-    queue = heap[:]
     visited_count = 0
+    queue = deque([0])
     while queue:
-        similarity, title = queue.pop(0)
+        index = queue.popleft()
+        if index >= len(heap):
+            continue
+
+        similarity, title = heap[index]
         visited_count += 1
         if title == target:
             return visited_count
+
+        queue.append(2 * index + 1)
+        queue.append(2 * index + 2)
     return visited_count
 
 # DFS search
 def dfs_search(heap, target):
     visited_count = 0
-    stack = [(0, 0)]
-    visited_indices = set()
 
-    # Stack for DFS
+    # Stack for DFS, a tree has no cycles so nothing needs a visited set
+    stack = deque([0])
     while stack:
-        index, level = stack.pop()
+        index = stack.pop()
         if index >= len(heap):
             continue
 
-        if index not in visited_indices:
-            visited_indices.add(index)
-            visited_count += 1
-
-            similarity, title = heap[index]
-            if title == target:
-                return visited_count
-
-            left_child_index = 2 * index + 1
-            right_child_index = 2 * index + 2
+        visited_count += 1
+        similarity, title = heap[index]
+        if title == target:
+            return visited_count
 
-            # Was going the wrong way so I just switched it
-            if right_child_index < len(heap):
-                stack.append((right_child_index, level + 1))
-            if left_child_index < len(heap):
-                stack.append((left_child_index, level + 1))
+        # Was going the wrong way so I just switched it
+        stack.append(2 * index + 2)
+        stack.append(2 * index + 1)
 
     return visited_count
 
-# draws the heap in bfs traversal order
-def draw_heap_bfs(canvas_widget, heap, x, y, delay=500, max_levels=5, node_size=20):
-    queue = [(x, y, 0, 0)]
+# Works out where every node within max_levels is drawn, using the same spacing as draw_heap
+def heap_layout(heap, x, y, max_levels=5, node_size=20):
+    positions = {}
     node_spacing = (2 ** max_levels) * node_size
+    vertical_spacing = 80
+    stack = [(0, x, y, 0)]
 
-    while queue:
-        node_x, node_y, index, level = queue.pop(0)
+    while stack:
+        index, node_x, node_y, level = stack.pop()
         if index >= len(heap) or level >= max_levels:
             continue
+        positions[index] = (node_x, node_y)
 
-        similarity, title = heap[index]
-        similarity = -similarity
-        node_text = f"{title}\n({similarity:.2f})"
+        horizontal_spacing = node_spacing / (2 ** (level + 1))
+        stack.append((2 * index + 1, node_x - horizontal_spacing, node_y + vertical_spacing, level + 1))
+        stack.append((2 * index + 2, node_x + horizontal_spacing, node_y + vertical_spacing, level + 1))
 
-        # Draw the node
-        canvas_widget.create_oval(
-            node_x - node_size, node_y - node_size, node_x + node_size, node_y + node_size,
-            fill="red", outline="black", tags=f"node_{index}"
-        )
+    return positions
 
-        # Calculates child positions
-        horizontal_spacing = node_spacing / (2 ** (level + 1))
-        vertical_spacing = 80
-        left_child_index = 2 * index + 1
-        right_child_index = 2 * index + 2
-
-        # Left child
-        if left_child_index < len(heap):
-            child_x = node_x - horizontal_spacing
-            child_y = node_y + vertical_spacing
-            queue.append((child_x, child_y, left_child_index, level + 1))
-            canvas_widget.create_line(node_x, node_y + node_size, child_x, child_y - node_size, width=2)
-
-        # Right child
-        if right_child_index < len(heap):
-            child_x = node_x + horizontal_spacing
-            child_y = node_y + vertical_spacing
-            queue.append((child_x, child_y, right_child_index, level + 1))
-            canvas_widget.create_line(node_x, node_y + node_size, child_x, child_y - node_size, width=2)
-
-        canvas_widget.update()
-        time.sleep(delay / 1000)
 
-#draws the heap in dfs traversal order
-def draw_heap_dfs(canvas_widget, heap, x, y, delay=500, index=0, level=0, max_levels=5, node_size=20):
-    if index >= len(heap) or level >= max_levels:
-        return
+# Node indexes in the order bfs or dfs visits them, limited to the drawn levels
+def traversal_order(heap, kind, max_levels=5):
+    node_count = min(len(heap), 2 ** max_levels - 1)
+    if kind == "bfs":
+        # A BFS over an array heap visits the nodes in array order
+        return list(range(node_count))
 
-    similarity, title = heap[index]
-    similarity = -similarity
-    node_text = f"{title}\n({similarity:.2f})"
-
-    # Draw the current node
-    canvas_widget.create_oval(
-        x - node_size, y - node_size, x + node_size, y + node_size,
-        fill="yellow", outline="black", tags=f"node_{index}"
-    )
-    canvas_widget.update()
-    time.sleep(delay / 1000)
-
-    # Calculate child positions
-    node_spacing = (2 ** max_levels) * node_size
-    horizontal_spacing = node_spacing / (2 ** (level + 1))
-    vertical_spacing = 80
-    left_child_index = 2 * index + 1
-    right_child_index = 2 * index + 2
-
-    # Traverse left
-    if left_child_index < len(heap):
-        child_x = x - horizontal_spacing
-        child_y = y + vertical_spacing
-        canvas_widget.create_line(x, y + node_size, child_x, child_y - node_size, width=2)
-        draw_heap_dfs(canvas_widget, heap, child_x, child_y, delay, left_child_index, level + 1, max_levels, node_size)
-
-    # Traverse right
-    if right_child_index < len(heap):
-        child_x = x + horizontal_spacing
-        child_y = y + vertical_spacing
-        canvas_widget.create_line(x, y + node_size, child_x, child_y - node_size, width=2)
-        draw_heap_dfs(canvas_widget, heap, child_x, child_y, delay, right_child_index, level + 1, max_levels, node_size)
+    order = []
+    stack = [0]
+    while stack:
+        index = stack.pop()
+        if index >= node_count:
+            continue
+        order.append(index)
+        # Right is pushed first so the left child is visited first
+        stack.append(2 * index + 2)
+        stack.append(2 * index + 1)
+    return order
+
+
+# Animates a traversal with after() callbacks instead of sleeping, so the window stays responsive.
+# The whole tree is drawn once in grey and every frame only recolors the next node and its edge
+class TraversalAnimation(object):
+    def __init__(self, canvas_widget, heap, x, y, order, color, delay=500, max_levels=5, node_size=20, on_done=None):
+        self.canvas = canvas_widget
+        self.order = order
+        self.color = color
+        self.delay = delay
+        self.on_done = on_done
+        self.step = 0
+        self.after_id = None
+        self.paused = False
+        self.cancelled = False
+
+        # Pre-compute the geometry and draw every edge and node once
+        positions = heap_layout(heap, x, y, max_levels, node_size)
+        self.nodes = {}
+        self.edges = {}
+        for index, (node_x, node_y) in positions.items():
+            parent = (index - 1) // 2
+            if index > 0 and parent in positions:
+                parent_x, parent_y = positions[parent]
+                self.edges[index] = canvas_widget.create_line(parent_x, parent_y + node_size, node_x, node_y - node_size,
+                                                              width=2, fill="#d0d0d0", tags="animation")
+        for index, (node_x, node_y) in positions.items():
+            similarity, title = heap[index]
+            self.nodes[index] = canvas_widget.create_oval(
+                node_x - node_size, node_y - node_size, node_x + node_size, node_y + node_size,
+                fill="#eeeeee", outline="#b0b0b0", tags=("animation", f"node_{index}")
+            )
+            CreateToolTip(canvas_widget, f"node_{index}", f"{title}\n({-similarity:.2f})", node_x, node_y)
+
+    def start(self):
+        self.schedule(0)
+
+    def schedule(self, delay):
+        self.after_id = self.canvas.after(delay, self.show_next)
+
+    # Colors the next visited node, then waits delay ms for the one after
+    def show_next(self):
+        self.after_id = None
+        if self.paused or self.cancelled:
+            return
+
+        index = self.order[self.step]
+        self.canvas.itemconfigure(self.nodes[index], fill=self.color, outline="black")
+        if index in self.edges:
+            self.canvas.itemconfigure(self.edges[index], fill="black")
+        self.step += 1
+
+        if self.finished:
+            if self.on_done:
+                self.on_done()
+        else:
+            self.schedule(self.delay)
+
+    @property
+    def finished(self):
+        return self.step >= len(self.order)
+
+    def pause(self):
+        self.paused = True
+        if self.after_id is not None:
+            self.canvas.after_cancel(self.after_id)
+            self.after_id = None
+
+    def resume(self):
+        if self.paused and not self.cancelled and not self.finished:
+            self.paused = False
+            self.schedule(0)
+
+    # Stops the animation for good, leaving the canvas as it is
+    def cancel(self):
+        self.pause()
+        self.cancelled = True
+
+    # Changes the time between frames, the next frame already uses it
+    def set_delay(self, delay):
+        self.delay = max(1, int(delay))
+
+
+# draws the heap in bfs traversal order
+def draw_heap_bfs(canvas_widget, heap, x, y, delay=500, max_levels=5, node_size=20, on_done=None):
+    animation = TraversalAnimation(canvas_widget, heap, x, y, traversal_order(heap, "bfs", max_levels),
+                                   "red", delay, max_levels, node_size, on_done)
+    animation.start()
+    return animation
+
+#draws the heap in dfs traversal order
+def draw_heap_dfs(canvas_widget, heap, x, y, delay=500, max_levels=5, node_size=20, on_done=None):
+    animation = TraversalAnimation(canvas_widget, heap, x, y, traversal_order(heap, "dfs", max_levels),
+                                   "yellow", delay, max_levels, node_size, on_done)
+    animation.start()
+    return animation
@@ -0,0 +1,150 @@
+import json
+import os
+import threading
+import time
+import tracemalloc
+from collections import deque
+
+# Off by default: a disabled stage() is a shared no-op context manager and count() returns at once
+enabled = False
+memory_sampling = False
+
+# Most trace events kept for export_trace, older ones are dropped
+TRACE_EVENTS = 100000
+
+lock = threading.Lock()
+stage_totals = {}
+counters = {}
+events = deque(maxlen=TRACE_EVENTS)
+last_traces = {}
+local = threading.local()
+clock_start = time.perf_counter()
+
+
+class NoStage(object):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+NO_STAGE = NoStage()
+
+
+# One timed stage. Stages opened while another one is running on the same thread belong to its trace,
+# and when the outermost stage ends that trace is kept as the latest one under its name
+class Stage(object):
+    __slots__ = ('name', 'started', 'memory_start')
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        stack = getattr(local, 'stack', None)
+        if stack is None:
+            stack = local.stack = []
+        if not stack:
+            local.trace = {'name': self.name, 'stages': {}, 'counters': {}}
+            if memory_sampling:
+                tracemalloc.reset_peak()
+        stack.append(self)
+
+        if memory_sampling:
+            self.memory_start = tracemalloc.get_traced_memory()[0]
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        duration = time.perf_counter() - self.started
+        args = {}
+        if memory_sampling and tracemalloc.is_tracing():
+            current, peak = tracemalloc.get_traced_memory()
+            args = {'memory_delta': current - self.memory_start, 'memory_peak': peak}
+
+        with lock:
+            totals = stage_totals.setdefault(self.name, [0, 0.0, 0.0])
+            totals[0] += 1
+            totals[1] += duration
+            totals[2] = max(totals[2], duration)
+            events.append({'name': self.name, 'ph': 'X', 'ts': (self.started - clock_start) * 1e6,
+                           'dur': duration * 1e6, 'pid': os.getpid(), 'tid': threading.get_ident(), 'args': args})
+
+        stack = local.stack
+        stack.pop()
+        trace = local.trace
+        trace['stages'][self.name] = trace['stages'].get(self.name, 0.0) + duration
+        if not stack:
+            trace['duration'] = duration
+            trace.update(args)
+            last_traces[self.name] = trace
+        return False
+
+
+# Times the code in a with block under name
+def stage(name):
+    if not enabled:
+        return NO_STAGE
+    return Stage(name)
+
+
+# Adds value to a counter, and to the counters of the trace running on this thread
+def count(name, value=1):
+    if not enabled:
+        return
+
+    with lock:
+        counters[name] = counters.get(name, 0) + value
+    if getattr(local, 'stack', None):
+        trace_counters = local.trace['counters']
+        trace_counters[name] = trace_counters.get(name, 0) + value
+
+
+def enable(memory=False):
+    global enabled, memory_sampling
+    memory_sampling = memory
+    if memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    enabled = True
+
+
+def disable():
+    global enabled, memory_sampling
+    enabled = False
+    if memory_sampling and tracemalloc.is_tracing():
+        tracemalloc.stop()
+    memory_sampling = False
+
+
+def reset():
+    with lock:
+        stage_totals.clear()
+        counters.clear()
+        events.clear()
+        last_traces.clear()
+
+
+# Totals per stage and counter since the last reset, plus the latest trace of every outermost stage
+def stats():
+    with lock:
+        return {
+            'enabled': enabled,
+            'stages': {name: {'calls': calls, 'total_ms': total * 1000, 'mean_ms': total * 1000 / calls,
+                              'max_ms': longest * 1000}
+                       for name, (calls, total, longest) in stage_totals.items()},
+            'counters': dict(counters),
+            'last': {name: dict(trace) for name, trace in last_traces.items()},
+        }
+
+
+# The latest trace of an outermost stage: its duration, the time of each stage inside it and its counters
+def last_trace(name):
+    return last_traces.get(name)
+
+
+# Writes the recorded stages in the Chrome trace event format, which chrome://tracing and Perfetto open
+def export_trace(path):
+    with lock:
+        trace_events = list(events)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({'traceEvents': trace_events, 'displayTimeUnit': 'ms'}, f)
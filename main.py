@@ -1,15 +1,34 @@
+import time
 import tkinter as tk
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
 from tkinter import ttk
-from data import find_similar_books, get_categories
-from heap import create_max_heap, draw_heap, draw_heap_bfs, draw_heap_dfs
+import instrumentation
+from engine import default_engine
+from heap import HeapRenderer, create_max_heap, draw_heap_bfs, draw_heap_dfs
+
+# Most results a search can list, and how many of the best ones go into the heap visualization
+MAX_RESULTS = 10000
+HEAP_RESULTS = 127
+
+# Rows inserted into the results table per Tk callback, and how many more are loaded
+# each time the table is scrolled near its end
+ROW_BATCH = 50
+PAGE_ROWS = 200
+
+# Suggestions are looked up once typing pauses for this long, and at most this many are listed
+SUGGEST_DELAY_MS = 150
+SUGGESTION_ROWS = 8
 
 
 class AdvancedSearchFrame(ttk.LabelFrame):
-    def __init__(self, parent, search_callback, bfs_callback, dfs_callback):
+    def __init__(self, parent, search_callback, bfs_callback, dfs_callback, suggest_callback):
         super().__init__(parent, text="Advanced Search", padding="10")
         self.search_callback = search_callback
         self.bfs_callback = bfs_callback
         self.dfs_callback = dfs_callback
+        self.suggest_callback = suggest_callback
+        self.suggest_job = None
         self.create_widgets()
 
     def create_widgets(self):
@@ -22,6 +41,15 @@ class AdvancedSearchFrame(ttk.LabelFrame):
         self.query_entry = ttk.Entry(basic_frame, width=50)
         self.query_entry.pack(side=tk.LEFT, padx=5)
 
+        # Suggestions drop down under the query entry while typing
+        self.suggestion_list = tk.Listbox(self.winfo_toplevel(), height=SUGGESTION_ROWS, activestyle='none')
+        self.query_entry.bind("<KeyRelease>", self.query_changed)
+        self.query_entry.bind("<Down>", self.focus_suggestions)
+        self.query_entry.bind("<Escape>", lambda event: self.hide_suggestions())
+        self.suggestion_list.bind("<Return>", self.accept_suggestion)
+        self.suggestion_list.bind("<ButtonRelease-1>", self.accept_suggestion)
+        self.suggestion_list.bind("<Escape>", lambda event: self.hide_suggestions())
+
         # Create frame for all filter options
         filters_frame = ttk.LabelFrame(self, text="Filters", padding="5")
         filters_frame.pack(fill=tk.X, pady=5)
@@ -30,8 +58,7 @@ class AdvancedSearchFrame(ttk.LabelFrame):
         ttk.Label(filters_frame, text="Category:").grid(row=0, column=0, padx=5, pady=5)
         self.category_var = tk.StringVar()
         self.category_combo = ttk.Combobox(filters_frame, textvariable=self.category_var, width=30)
-        self.category_combo['values'] = ['All'] + get_categories()
-        self.category_combo.current(0)
+        self.set_categories([])
         self.category_combo.grid(row=0, column=1, padx=5, pady=5)
 
         # Add author entry field
@@ -49,7 +76,7 @@ class AdvancedSearchFrame(ttk.LabelFrame):
         # Add results limit spinner
         ttk.Label(filters_frame, text="Max Results:").grid(row=1, column=2, padx=5, pady=5)
         self.limit_var = tk.StringVar(value="10")
-        self.limit_spin = ttk.Spinbox(filters_frame, from_=1, to=31, textvariable=self.limit_var, width=5)
+        self.limit_spin = ttk.Spinbox(filters_frame, from_=1, to=MAX_RESULTS, textvariable=self.limit_var, width=5)
         self.limit_spin.grid(row=1, column=3, padx=5, pady=5)
 
         # Create frame for buttons
@@ -62,8 +89,61 @@ class AdvancedSearchFrame(ttk.LabelFrame):
         ttk.Button(button_frame, text="BFS Visualization", command=self.bfs_callback).pack(side=tk.LEFT, padx=5)
         ttk.Button(button_frame, text="DFS Visualization", command=self.dfs_callback).pack(side=tk.LEFT, padx=5)
 
+    # Asks for suggestions once typing pauses, so a fast typist does not start a lookup per key
+    def query_changed(self, event):
+        if event.keysym in ('Down', 'Up', 'Return', 'Escape'):
+            return
+        if self.suggest_job is not None:
+            self.after_cancel(self.suggest_job)
+        self.suggest_job = self.after(SUGGEST_DELAY_MS, self.request_suggestions)
+
+    def request_suggestions(self):
+        self.suggest_job = None
+        text = self.query_entry.get()
+        if text.strip():
+            self.suggest_callback(text, self.show_suggestions)
+        else:
+            self.hide_suggestions()
+
+    # Lists the suggestions for text, unless the query has changed since they were asked for
+    def show_suggestions(self, text, suggestions):
+        if text != self.query_entry.get():
+            return
+        if not suggestions:
+            self.hide_suggestions()
+            return
+
+        self.suggestion_list.delete(0, tk.END)
+        for suggestion in suggestions:
+            self.suggestion_list.insert(tk.END, suggestion)
+        self.suggestion_list.configure(height=min(len(suggestions), SUGGESTION_ROWS))
+        self.suggestion_list.place(in_=self.query_entry, relx=0, rely=1, relwidth=1)
+        self.suggestion_list.lift()
+
+    def hide_suggestions(self):
+        self.suggestion_list.place_forget()
+
+    def focus_suggestions(self, event):
+        if self.suggestion_list.winfo_ismapped():
+            self.suggestion_list.focus_set()
+            self.suggestion_list.selection_clear(0, tk.END)
+            self.suggestion_list.selection_set(0)
+            self.suggestion_list.activate(0)
+
+    # Puts the chosen suggestion in the query entry
+    def accept_suggestion(self, event):
+        selection = self.suggestion_list.curselection()
+        if not selection:
+            return
+        self.query_entry.delete(0, tk.END)
+        self.query_entry.insert(0, self.suggestion_list.get(selection[0]))
+        self.hide_suggestions()
+        self.query_entry.focus_set()
+        self.query_entry.icursor(tk.END)
+
     # Handles the search button click
     def perform_search(self):
+        self.hide_suggestions()
         query = self.query_entry.get()
         if not query:
             return
@@ -79,8 +159,17 @@ class AdvancedSearchFrame(ttk.LabelFrame):
 
         self.search_callback(query, filters)
 
+    # Fills the category dropdown, keeping 'All' first. A category already picked (say from the saved
+    # list while the index was loading) stays picked if it is still in the list
+    def set_categories(self, categories):
+        values = ['All'] + list(categories)
+        self.category_combo['values'] = values
+        if self.category_var.get() not in values:
+            self.category_combo.current(0)
+
     # Resets all filters to default values
     def clear_filters(self):
+        self.hide_suggestions()
         self.query_entry.delete(0, tk.END)
         self.category_combo.current(0)
         self.author_entry.delete(0, tk.END)
@@ -94,12 +183,31 @@ class BookRecommenderApp:
         self.root = tk.Tk()
         self.root.title("Book Recommender System")
         self.max_heap = []
+        self.animation = None
+
+        # Searches and the index load run on one worker thread so the window never freezes
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.load_future = None
+        self.search_future = None
+        self.page_future = None
+        self.search_generation = 0
+        self.search_stage = 'search'
+
+        # Results of the last search that are not in the table yet, streamed in as it is scrolled.
+        # result_rows is only advanced on the worker, which ranks the next page, ranked_rows holds that page
+        self.result_rows = iter(())
+        self.ranked_rows = []
+        self.rows_total = 0
+        self.rows_shown = 0
+        self.rows_wanted = 0
+        self.filling_table = False
 
         # Configure window appearance
         self.root.configure(bg='#f0f0f0')
         self.root.geometry("1200x800")
 
         self.create_gui()
+        self.load_index()
 
     # Creates all GUI elements
     def create_gui(self):
@@ -113,7 +221,8 @@ class BookRecommenderApp:
             self.root,
             self.perform_filtered_search,
             self.perform_bfs,
-            self.perform_dfs
+            self.perform_dfs,
+            self.suggest
         )
         self.advanced_search.pack(fill=tk.X, padx=10, pady=5)
 
@@ -126,22 +235,50 @@ class BookRecommenderApp:
         self.viz_frame = ttk.Frame(self.notebook)
         self.notebook.add(self.viz_frame, text="Heap Visualization")
 
+        # Add controls for the traversal animations
+        animation_frame = ttk.Frame(self.viz_frame)
+        animation_frame.pack(fill=tk.X, pady=2)
+
+        self.pause_button = ttk.Button(animation_frame, text="Pause", command=self.toggle_animation_pause)
+        self.pause_button.pack(side=tk.LEFT, padx=5)
+        ttk.Button(animation_frame, text="Stop", command=self.stop_animation).pack(side=tk.LEFT, padx=5)
+
+        ttk.Label(animation_frame, text="Step Delay (ms):").pack(side=tk.LEFT, padx=5)
+        self.delay_var = tk.StringVar(value="500")
+        delay_spin = ttk.Spinbox(animation_frame, from_=50, to=2000, increment=50,
+                                 textvariable=self.delay_var, width=6, command=self.change_animation_speed)
+        delay_spin.bind("<Return>", lambda event: self.change_animation_speed())
+        delay_spin.pack(side=tk.LEFT, padx=5)
+
         # Add canvas with scrollbar for visualization
         canvas_frame = ttk.Frame(self.viz_frame)
         canvas_frame.pack(fill=tk.BOTH, expand=True)
 
         self.canvas = tk.Canvas(canvas_frame, bg="white")
+        self.heap_renderer = HeapRenderer(self.canvas)
+
+        # Scrolling goes through the renderer so newly visible nodes get drawn
         scrollbar = ttk.Scrollbar(canvas_frame, orient=tk.VERTICAL,
-                                  command=self.canvas.yview)
-        self.canvas.configure(yscrollcommand=scrollbar.set)
+                                  command=self.heap_renderer.yview)
+        x_scrollbar = ttk.Scrollbar(canvas_frame, orient=tk.HORIZONTAL,
+                                    command=self.heap_renderer.xview)
+        self.canvas.configure(yscrollcommand=scrollbar.set, xscrollcommand=x_scrollbar.set)
 
         scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        x_scrollbar.pack(side=tk.BOTTOM, fill=tk.X)
         self.canvas.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
 
         # Create results tab
         results_frame = ttk.Frame(self.notebook)
         self.notebook.add(results_frame, text="Search Results")
 
+        # Add a button that searches for books like the selected one
+        results_toolbar = ttk.Frame(results_frame)
+        results_toolbar.pack(side=tk.TOP, fill=tk.X, pady=2)
+        self.more_like_button = ttk.Button(results_toolbar, text="More Like This",
+                                           command=self.more_like_this, state=tk.DISABLED)
+        self.more_like_button.pack(side=tk.LEFT, padx=5)
+
         # Add treeview for results with scrollbar
         self.tree = ttk.Treeview(results_frame, columns=("Title", "Author", "Similarity"),
                                  show="headings", height=10)
@@ -158,86 +295,305 @@ class BookRecommenderApp:
         # Add scrollbar to treeview
         scrollbar = ttk.Scrollbar(results_frame, orient=tk.VERTICAL,
                                   command=self.tree.yview)
-        self.tree.configure(yscrollcommand=scrollbar.set)
+        self.tree.configure(yscrollcommand=lambda first, last: self.table_scrolled(scrollbar, first, last))
 
         self.tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
         scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
 
         # Bind double-click event for Google search
         self.tree.bind("<Double-1>", self.open_google_search)
+        self.tree.bind("<<TreeviewSelect>>", self.selection_changed)
 
     # Creates the status bar at bottom of window
     def create_status_bar(self):
+        status_frame = ttk.Frame(self.root)
+        status_frame.pack(side=tk.BOTTOM, fill=tk.X)
+
+        # Stage timings of the last search, only measured while the box is ticked
+        self.timings_enabled = tk.BooleanVar(value=instrumentation.enabled)
+        ttk.Checkbutton(status_frame, text="Show Timings", variable=self.timings_enabled,
+                        command=self.toggle_timings).pack(side=tk.RIGHT, padx=5)
+        self.timings_var = tk.StringVar()
+        self.timings_label = ttk.Label(status_frame, textvariable=self.timings_var, relief=tk.SUNKEN, anchor=tk.W)
+
         self.status_var = tk.StringVar()
-        status_bar = ttk.Label(self.root, textvariable=self.status_var,
+        status_bar = ttk.Label(status_frame, textvariable=self.status_var,
                                relief=tk.SUNKEN, anchor=tk.W)
         status_bar.pack(side=tk.BOTTOM, fill=tk.X)
         self.status_var.set("Ready")
+        if instrumentation.enabled:
+            self.timings_label.pack(side=tk.TOP, fill=tk.X)
+
+    # Waits for a background job without blocking, showing progress in the status bar,
+    # then hands the finished future to callback on the Tk thread
+    def when_done(self, future, callback, message, started=None):
+        if started is None:
+            started = time.monotonic()
+
+        if future.done():
+            callback(future)
+            return
+
+        # A superseded search no longer reports progress
+        if future is self.search_future or future is self.load_future:
+            self.status_var.set(f"{message} ({time.monotonic() - started:.1f}s)")
+        self.root.after(50, self.when_done, future, callback, message, started)
+
+    # Loads the book index in the background and fills the categories once it is ready
+    # Categories saved by an earlier run are shown at once, the index itself loads in the background
+    def load_index(self):
+        categories = default_engine.saved_categories()
+        if categories is not None:
+            self.advanced_search.set_categories(categories)
+
+        self.load_future = self.executor.submit(default_engine.preload)
+        self.when_done(self.load_future, self.index_loaded, "Loading book index...")
+
+    def index_loaded(self, future):
+        try:
+            self.advanced_search.set_categories(future.result())
+        except Exception as e:
+            self.status_var.set(f"Error: {str(e)}")
+            return
+
+        # A search started while loading reports its own progress
+        if self.search_future is None or self.search_future.done():
+            self.status_var.set("Ready")
+
+    # Looks up suggestions right away, the quick lookup takes a fraction of a millisecond, so it neither
+    # blocks the window nor queues behind searches on the worker. Nothing is suggested until the index has loaded
+    def suggest(self, text, callback):
+        if default_engine.index is None:
+            return
+        callback(text, default_engine.suggest(text, SUGGESTION_ROWS, quick=True))
 
     # Handles the search functionality
     def perform_filtered_search(self, query, filters):
+        # Get search results on the worker thread
+        self.start_search("Searching...", filters['limit'], self.search_cursor, query, filters)
+
+    # Runs on the worker thread: all results as a cursor the table reads a page at a time,
+    # and the best ones for the heap
+    def search_cursor(self, query, filters):
+        cursor = default_engine.search_cursor(query, filters['min_similarity'], filters['category'], filters['author'])
+        return cursor, cursor.head(min(filters['limit'], HEAP_RESULTS))
+
+    # Runs on the worker thread
+    def similar_books(self, book_id, top_n):
+        results = default_engine.similar_to_book(book_id, top_n)
+        return results, results.head(HEAP_RESULTS)
+
+    # Searches for the books most similar to the selected result
+    def more_like_this(self):
+        selected_item = self.tree.selection()
+        if not selected_item:
+            return
+
+        try:
+            limit = int(self.advanced_search.limit_var.get())
+        except ValueError:
+            limit = 10
+        self.start_search("Finding similar books...", limit, self.similar_books, int(selected_item[0]), limit)
+
+    # Runs a search on the worker thread. A newer search replaces any search still waiting or running.
+    # search returns the ranked results and the best of them for the heap, limit caps the rows listed
+    def start_search(self, message, limit, search, *args, **kwargs):
+        if self.search_future is not None:
+            self.search_future.cancel()
+        if self.page_future is not None:
+            self.page_future.cancel()
+            self.page_future = None
+        self.search_generation += 1
+        generation = self.search_generation
+
+        # The stage the search is timed under, for the timings overlay
+        self.search_stage = 'similar_to_book' if search == self.similar_books else 'search'
+        self.search_future = self.executor.submit(search, *args, **kwargs)
+        self.when_done(self.search_future, lambda future: self.show_results(future, generation, limit), message)
+
+    def selection_changed(self, event):
+        self.more_like_button.configure(state=tk.NORMAL if self.tree.selection() else tk.DISABLED)
+
+    # Shows the results of a finished search, unless a newer search has been started since
+    def show_results(self, future, generation, limit):
+        if generation != self.search_generation or future.cancelled():
+            return
+
         try:
-            self.status_var.set("Searching...")
-            self.root.update()
-
-            # Get search results
-            similar_books = find_similar_books(
-                query,
-                top_n=filters['limit'],
-                min_similarity=filters['min_similarity'],
-                category_filter=filters['category'],
-                author_filter=filters['author']
-            )
-
-            self.max_heap = create_max_heap(similar_books)
-
-            # Clear previous results
-            self.canvas.delete("all")
-            for row in self.tree.get_children():
-                self.tree.delete(row)
-
-            # Draw new heap visualization
-            canvas_width = self.canvas.winfo_width()
-            draw_heap(self.canvas, self.max_heap, canvas_width // 2, 50)
-
-            # Update results table
-            for _, row in similar_books.iterrows():
+            similar_books, top_books = future.result()
+
+            with instrumentation.stage('show_results'):
+                # Only the top of the results goes into the heap, the table lists them all
+                with instrumentation.stage('heap_build'):
+                    self.max_heap = create_max_heap(top_books)
+
+                # Clear previous results
+                self.stop_animation()
+                self.canvas.delete("animation", "text")
+                for row in self.tree.get_children():
+                    self.tree.delete(row)
+                self.more_like_button.configure(state=tk.DISABLED)
+
+                # Draw new heap visualization
+                with instrumentation.stage('draw_heap'):
+                    canvas_width = self.canvas.winfo_width()
+                    self.heap_renderer.draw(self.max_heap, canvas_width // 2, 50)
+
+                # The table is filled a batch at a time, the first page now and more as it is scrolled
+                self.result_rows = iter(similar_books)
+                self.ranked_rows = []
+                self.rows_total = min(len(similar_books), limit)
+                self.rows_shown = 0
+                self.rows_wanted = min(PAGE_ROWS, self.rows_total)
+                self.fill_table(generation)
+
+            self.show_timings()
+
+        except Exception as e:
+            self.status_var.set(f"Error: {str(e)}")
+
+    # Runs on the worker thread: ranks the next count results
+    def next_page(self, result_rows, count):
+        return list(islice(result_rows, count))
+
+    # Inserts the next batch of ranked rows, and schedules itself until the rows asked for are in the table.
+    # Once the ranked rows run out the worker ranks another page, so a deep scroll never sorts on the Tk thread
+    def fill_table(self, generation):
+        self.filling_table = False
+        if generation != self.search_generation:
+            return
+
+        with instrumentation.stage('fill_table'):
+            count = max(min(ROW_BATCH, self.rows_wanted - self.rows_shown, len(self.ranked_rows)), 0)
+            batch, self.ranked_rows = self.ranked_rows[:count], self.ranked_rows[count:]
+            for match in batch:
                 # Clean up author display
-                author = row['Authors']
+                author = match.authors
                 author_display = author.replace('By', '') if author else 'Unknown'
 
-                self.tree.insert("", "end", values=(
-                    row['Title'],
+                self.tree.insert("", "end", iid=str(match.book_id), values=(
+                    match.title,
                     author_display,
-                    f"{row['similarity']:.3f}"
+                    f"{match.similarity:.3f}"
                 ))
-
-            self.status_var.set(f"Found {len(similar_books)} matching books")
-
+                self.rows_shown += 1
+
+        if self.rows_shown < self.rows_total:
+            self.status_var.set(f"Found {self.rows_total} matching books, showing {self.rows_shown}")
+        else:
+            self.status_var.set(f"Found {self.rows_total} matching books")
+
+        if self.rows_shown < self.rows_wanted:
+            self.filling_table = True
+            if self.ranked_rows:
+                self.root.after(1, self.fill_table, generation)
+            else:
+                count = min(max(PAGE_ROWS, self.rows_wanted - self.rows_shown), self.rows_total - self.rows_shown)
+                self.page_future = self.executor.submit(self.next_page, self.result_rows, count)
+                self.when_done(self.page_future, lambda future: self.page_ranked(future, generation),
+                               "Loading results...")
+
+    # Queues the rows of a page ranked on the worker, unless a newer search has been started since
+    def page_ranked(self, future, generation):
+        self.page_future = None
+        if generation != self.search_generation or future.cancelled():
+            return
+        try:
+            self.ranked_rows = future.result()
         except Exception as e:
+            self.filling_table = False
             self.status_var.set(f"Error: {str(e)}")
+            return
 
-    # Performs BFS visualization
-    def perform_bfs(self):
-        if not self.max_heap:
-            self.status_var.set("No data to visualize. Please perform a search first.")
+        # The search ran out of results before the table did
+        if not self.ranked_rows:
+            self.rows_total = self.rows_wanted = self.rows_shown
+        self.fill_table(generation)
+
+    # Loads another page of results once the table is scrolled close to its last row
+    def table_scrolled(self, scrollbar, first, last):
+        scrollbar.set(first, last)
+        if float(last) < 0.9 or self.rows_wanted >= self.rows_total:
             return
 
-        self.canvas.delete("all")
-        self.status_var.set("Performing BFS traversal...")
-        draw_heap_bfs(self.canvas, self.max_heap, self.canvas.winfo_width() // 2, 50)
-        self.status_var.set("BFS traversal complete")
+        self.rows_wanted = min(max(self.rows_wanted, self.rows_shown + PAGE_ROWS), self.rows_total)
+        if not self.filling_table:
+            self.filling_table = True
+            self.root.after(1, self.fill_table, self.search_generation)
+
+    def toggle_timings(self):
+        if self.timings_enabled.get():
+            instrumentation.enable()
+            self.timings_label.pack(side=tk.TOP, fill=tk.X)
+            self.timings_var.set("Timings are shown after the next search")
+        else:
+            instrumentation.disable()
+            self.timings_label.pack_forget()
+
+    # Shows where the time of the last search went, from the searching to the drawing
+    def show_timings(self):
+        if not instrumentation.enabled:
+            return
+
+        parts = []
+        for name in (self.search_stage, 'show_results'):
+            trace = instrumentation.last_trace(name)
+            if trace is None:
+                continue
+            stages = ', '.join(f"{stage} {seconds * 1000:.1f}" for stage, seconds in trace['stages'].items()
+                               if stage != name)
+            parts.append(f"{name} {trace['duration'] * 1000:.1f} ms" + (f" ({stages})" if stages else ""))
+            parts.extend(f"{counter} {value}" for counter, value in trace['counters'].items())
+        self.timings_var.set(" | ".join(parts))
+
+    # Performs BFS visualization
+    def perform_bfs(self):
+        self.start_animation("BFS", draw_heap_bfs)
 
     # Performs DFS visualization
     def perform_dfs(self):
+        self.start_animation("DFS", draw_heap_dfs)
+
+    # Replaces any running animation with a new traversal, drawn frame by frame from the event loop
+    def start_animation(self, name, draw_traversal):
         if not self.max_heap:
             self.status_var.set("No data to visualize. Please perform a search first.")
             return
 
-        self.canvas.delete("all")
-        self.status_var.set("Performing DFS traversal...")
-        draw_heap_dfs(self.canvas, self.max_heap, self.canvas.winfo_width() // 2, 50)
-        self.status_var.set("DFS traversal complete")
+        self.stop_animation()
+        self.canvas.delete("animation", "text")
+        self.heap_renderer.clear()
+        self.status_var.set(f"Performing {name} traversal...")
+        self.animation = draw_traversal(self.canvas, self.max_heap, self.canvas.winfo_width() // 2, 50,
+                                        delay=self.animation_delay(),
+                                        on_done=lambda: self.status_var.set(f"{name} traversal complete"))
+
+    def animation_delay(self):
+        try:
+            return max(1, int(float(self.delay_var.get())))
+        except ValueError:
+            return 500
+
+    def change_animation_speed(self):
+        if self.animation is not None:
+            self.animation.set_delay(self.animation_delay())
+
+    def toggle_animation_pause(self):
+        if self.animation is None or self.animation.finished:
+            return
+
+        if self.animation.paused:
+            self.animation.resume()
+            self.pause_button.configure(text="Pause")
+        else:
+            self.animation.pause()
+            self.pause_button.configure(text="Resume")
+
+    def stop_animation(self):
+        if self.animation is not None:
+            self.animation.cancel()
+            self.animation = None
+        self.pause_button.configure(text="Pause")
 
     # Opens Google search for selected book
     def open_google_search(self, event):
@@ -251,6 +607,7 @@ class BookRecommenderApp:
     # Starts the application
     def run(self):
         self.root.mainloop()
+        self.executor.shutdown(wait=False, cancel_futures=True)
 
 
 # Creates and runs the application
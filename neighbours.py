@@ -0,0 +1,170 @@
+import argparse
+import itertools
+import json
+import os
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+# Neighbours kept per book, and how many books one worker task compares against the catalog at a time
+NEIGHBOURS_K = 50
+NEIGHBOUR_BLOCK_ROWS = 512
+
+# Tables kept in an index folder: the saved index's own and the one of the latest refit
+NEIGHBOUR_TABLES_KEPT = 2
+
+
+# Top k neighbours of the rows start to stop, best first with ties going to the lower id.
+# Rows with fewer than k matching books are padded with id -1
+def block_neighbours(tfidf_matrix, tfidf_matrix_t, start, stop, k):
+    similarities = (tfidf_matrix[start:stop] @ tfidf_matrix_t).tocsr()
+    similarities.sort_indices()
+
+    ids = np.full((stop - start, k), -1, dtype=np.int32)
+    scores = np.zeros((stop - start, k), dtype=np.float16)
+    for row in range(stop - start):
+        begin, end = similarities.indptr[row], similarities.indptr[row + 1]
+        columns = similarities.indices[begin:end]
+        values = similarities.data[begin:end]
+
+        # A book is not its own neighbour
+        keep = (columns != start + row) & (values > 0)
+        columns, values = columns[keep], values[keep]
+        if len(values) > k:
+            best = np.argpartition(values, len(values) - k)[len(values) - k:]
+            kth = values[best].min()
+            # Ties at the cut-off are settled by id like in the search results
+            best = np.concatenate([np.flatnonzero(values > kth), np.flatnonzero(values == kth)])[:k]
+            columns, values = columns[best], values[best]
+
+        order = np.lexsort((columns, -values))
+        ids[row, :len(order)] = columns[order]
+        scores[row, :len(order)] = values[order]
+    return ids, scores
+
+
+# Computes the neighbour table in row blocks spread over a thread pool (the sparse kernels release the GIL).
+# Every block is compared with the whole catalog, so the cost grows with the square of the catalog
+def build_neighbours(tfidf_matrix, k=NEIGHBOURS_K, block_rows=NEIGHBOUR_BLOCK_ROWS, workers=None):
+    n_books = tfidf_matrix.shape[0]
+    tfidf_matrix_t = tfidf_matrix.T.tocsr()
+    starts = range(0, n_books, block_rows)
+    stops = [min(start + block_rows, n_books) for start in starts]
+    workers = workers or os.cpu_count() or 1
+
+    # A catalog that fits in one block (or a single worker) is not worth starting threads for
+    if len(starts) <= 1 or workers == 1:
+        blocks = [block_neighbours(tfidf_matrix, tfidf_matrix_t, start, stop, k) for start, stop in zip(starts, stops)]
+    else:
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='neighbours') as pool:
+            blocks = list(pool.map(block_neighbours, itertools.repeat(tfidf_matrix), itertools.repeat(tfidf_matrix_t),
+                                   starts, stops, itertools.repeat(k)))
+
+    if not blocks:
+        return NeighbourTable(np.empty((0, k), dtype=np.int32), np.empty((0, k), dtype=np.float16))
+    return NeighbourTable(np.concatenate([ids for ids, _ in blocks]),
+                          np.concatenate([scores for _, scores in blocks]))
+
+
+# Identifies the matrix a saved table was computed from
+def matrix_checksum(tfidf_matrix):
+    checksum = 0
+    for array in (tfidf_matrix.indptr, tfidf_matrix.indices, tfidf_matrix.data):
+        checksum = zlib.crc32(np.ascontiguousarray(array), checksum)
+    return checksum
+
+
+# Files of the table computed from a matrix with the given checksum
+def table_path(directory, checksum, part):
+    return os.path.join(directory, f'neighbours_{checksum:08x}_{part}')
+
+
+# Saves the table under the checksum of its matrix, so a refitted index does not replace the table of the
+# saved one. Only the NEIGHBOUR_TABLES_KEPT most recently saved tables are kept
+def save_neighbours(directory, tfidf_matrix, table):
+    os.makedirs(directory, exist_ok=True)
+    checksum = matrix_checksum(tfidf_matrix)
+
+    # Like the index, the manifest goes last so a half written table is never loaded
+    manifest_path = table_path(directory, checksum, 'manifest.json')
+    if os.path.exists(manifest_path):
+        os.remove(manifest_path)
+
+    np.save(table_path(directory, checksum, 'ids.npy'), table.ids)
+    np.save(table_path(directory, checksum, 'scores.npy'), table.scores)
+
+    with open(manifest_path, 'w', encoding='utf-8') as f:
+        json.dump({'shape': list(tfidf_matrix.shape), 'checksum': checksum}, f)
+
+    manifests = sorted((os.path.join(directory, name) for name in os.listdir(directory)
+                        if name.startswith('neighbours_') and name.endswith('_manifest.json')), key=os.path.getmtime)
+    for old_manifest in manifests[:-NEIGHBOUR_TABLES_KEPT]:
+        prefix = old_manifest[:-len('manifest.json')]
+        for part in ('manifest.json', 'ids.npy', 'scores.npy'):
+            if os.path.exists(prefix + part):
+                os.remove(prefix + part)
+
+
+# Loads a saved table, or returns None if there is none for this matrix
+def load_neighbours(directory, tfidf_matrix):
+    checksum = matrix_checksum(tfidf_matrix)
+    try:
+        with open(table_path(directory, checksum, 'manifest.json'), encoding='utf-8') as f:
+            manifest = json.load(f)
+        if manifest != {'shape': list(tfidf_matrix.shape), 'checksum': checksum}:
+            return None
+
+        return NeighbourTable(np.load(table_path(directory, checksum, 'ids.npy'), mmap_mode='r'),
+                              np.load(table_path(directory, checksum, 'scores.npy'), mmap_mode='r'))
+    except (OSError, ValueError):
+        return None
+
+
+# Precomputed top k neighbours of every book: row b of ids and scores lists the books most similar to b.
+# Books changed or added since the table was computed are listed in changed: the rows of changed books are
+# marked stale as they no longer describe them, and no row accounts for what a changed book is now
+class NeighbourTable:
+    def __init__(self, ids, scores, stale=None, changed=None):
+        self.ids = ids
+        self.scores = scores
+        self.k = ids.shape[1]
+        self.stale = np.zeros(len(ids), dtype=bool) if stale is None else stale
+        self.changed = np.empty(0, dtype=np.int64) if changed is None else changed
+
+    # A copy with the given books marked as changed (ids past the end are new books without a row)
+    def with_changes(self, book_ids):
+        book_ids = np.asarray(book_ids, dtype=np.int64)
+        stale = self.stale.copy()
+        stale[book_ids[book_ids < len(stale)]] = True
+        return NeighbourTable(self.ids, self.scores, stale, np.union1d(self.changed, book_ids))
+
+    # Neighbour ids and scores of book_id from its row, without padding and changed books, or None when the
+    # row cannot answer for its top_n neighbours: the book changed itself, or changed books left a full
+    # row with fewer than top_n others (the next best books were cut off when the row was computed)
+    def lookup(self, book_id, top_n):
+        if book_id >= len(self.ids) or self.stale[book_id] or top_n > self.k:
+            return None
+
+        ids = np.asarray(self.ids[book_id], dtype=np.int64)
+        full = ids[-1] >= 0
+        keep = ids >= 0
+        keep[keep] = ~self.stale[ids[keep]]
+        if full and np.count_nonzero(keep) < top_n:
+            return None
+        return ids[keep], np.asarray(self.scores[book_id], dtype=np.float64)[keep]
+
+
+# Builds the neighbour table of a catalog's index ahead of time, so the first similar_to_book does not wait
+def main():
+    parser = argparse.ArgumentParser(description="Build and save the neighbour table of the book index")
+    parser.add_argument('--csv', help="catalog CSV (the one the GUI and the service use when not given)")
+    parser.add_argument('--index-dir', help="folder of the saved index, where the table is saved too")
+    args = parser.parse_args()
+
+    from engine import SearchEngine, file_path, index_dir
+    SearchEngine(args.csv or file_path, args.index_dir or index_dir).build_neighbours()
+
+
+if __name__ == "__main__":
+    main()
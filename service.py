@@ -0,0 +1,282 @@
+import argparse
+import asyncio
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qsl, urlsplit
+
+import instrumentation
+from engine import default_engine
+
+# Largest request head and body the service reads
+MAX_HEADER_BYTES = 16 * 1024
+MAX_BODY_BYTES = 1024 * 1024
+
+STATUS_TEXT = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+               413: 'Payload Too Large', 500: 'Internal Server Error'}
+
+
+# Raised while handling a request to answer it with an error status
+class HttpError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+# Search parameters from the query string or JSON body, with the same defaults as find_similar_books
+def search_params(fields):
+    query = fields.get('q') or fields.get('query')
+    if not query:
+        raise HttpError(400, "Missing search query 'q'")
+
+    # JSON bodies can hold any type, and the batcher groups searches on these values
+    for name in ('q', 'query', 'category', 'author', 'mode'):
+        if fields.get(name) is not None and not isinstance(fields[name], str):
+            raise HttpError(400, f"'{name}' must be a string")
+
+    try:
+        return query, {
+            'top_n': int(fields.get('top_n', 10)),
+            'min_similarity': float(fields.get('min_similarity', 0.3)),
+            'category_filter': fields.get('category') or None,
+            'author_filter': fields.get('author') or None,
+            'mode': fields.get('mode', 'exact'),
+        }
+    except (TypeError, ValueError):
+        raise HttpError(400, "top_n and min_similarity must be numbers")
+
+
+def results_json(results):
+    return [{'book_id': match.book_id, 'title': match.title, 'authors': match.authors,
+             'similarity': float(match.similarity)} for match in results]
+
+
+# Hands searches to the worker pool. While every worker is busy new searches wait in the queue,
+# and the ones sharing their filters are then handed to one worker together (see run_searches)
+class SearchBatcher:
+    def __init__(self, executor, workers, max_batch=32, max_wait=0.002):
+        self.executor = executor
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.queue = asyncio.Queue()
+        self.free_workers = asyncio.Semaphore(workers)
+
+    async def search(self, query, params):
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((query, params, future))
+        return await future
+
+    # Takes waiting searches off the queue whenever a worker is free
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await self.free_workers.acquire()
+            pending = [await self.queue.get()]
+
+            # Searches that piled up show the service is under load, so give stragglers a moment to join
+            if not self.queue.empty():
+                deadline = loop.time() + self.max_wait
+                while len(pending) < self.max_batch:
+                    try:
+                        pending.append(await asyncio.wait_for(self.queue.get(), deadline - loop.time()))
+                    except asyncio.TimeoutError:
+                        break
+
+            # A batch that cannot be started fails its own searches, the loop keeps serving the next ones
+            try:
+                self.start_batch(loop, pending)
+            except Exception as e:
+                self.free_workers.release()
+                for _, _, future in pending:
+                    if not future.done():
+                        future.set_exception(e)
+
+    # Runs the searches of a batch on the workers, grouped by their search parameters
+    def start_batch(self, loop, pending):
+        groups = {}
+        for query, params, future in pending:
+            groups.setdefault(tuple(sorted(params.items())), []).append((query, future))
+
+        # The worker is released when the last group of this batch is done
+        remaining = [len(groups)]
+        for key, searches in groups.items():
+            task = loop.run_in_executor(self.executor, run_searches, [query for query, _ in searches], dict(key))
+            task.add_done_callback(lambda task, searches=searches: self.finished(task, searches, remaining))
+
+    def finished(self, task, searches, remaining):
+        remaining[0] -= 1
+        if remaining[0] == 0:
+            self.free_workers.release()
+
+        for i, (_, future) in enumerate(searches):
+            if future.done():
+                continue
+            if task.exception() is not None:
+                future.set_exception(task.exception())
+            else:
+                future.set_result(task.result()[i])
+
+
+# Runs on a worker thread. A batch search scans every book, which only beats searching the queries one by one
+# (each through the cache and the posting lists) when there is no threshold to prune with
+def run_searches(queries, params):
+    if len(queries) == 1 or params['mode'] != 'exact' or params['min_similarity'] > 0:
+        return [default_engine.find_similar_books(query, **params) for query in queries]
+
+    batch_params = dict(params)
+    del batch_params['mode']
+    return default_engine.find_similar_books_batch(queries, **batch_params)
+
+
+class SearchService:
+    def __init__(self, workers, max_batch, max_wait):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='search')
+        self.batcher = SearchBatcher(self.executor, workers, max_batch, max_wait)
+
+    async def handle_search(self, fields):
+        query, params = search_params(fields)
+        try:
+            # Cache hits are answered right away instead of waiting for a worker
+            results = default_engine.cached_results(query, **params)
+            if results is None:
+                results = await self.batcher.search(query, params)
+        except (KeyError, ValueError) as e:
+            raise HttpError(400, str(e))
+        return {'query': query, 'results': results_json(results)}
+
+    async def handle_categories(self, fields):
+        categories = await asyncio.get_running_loop().run_in_executor(self.executor, default_engine.categories)
+        return {'categories': categories}
+
+    async def handle_stats(self, fields):
+        return dict(default_engine.cache_stats(), timings=instrumentation.stats())
+
+    # Answers one parsed request with a status and a JSON-serializable body
+    async def route(self, method, target, body):
+        url = urlsplit(target)
+        path = url.path.rstrip('/') or '/'
+        handlers = {'/search': self.handle_search, '/categories': self.handle_categories, '/stats': self.handle_stats}
+        handler = handlers.get(path)
+        if handler is None:
+            raise HttpError(404, f"No such endpoint: {url.path}")
+
+        # Searches can also be sent as a JSON object
+        fields = dict(parse_qsl(url.query))
+        if method == 'POST' and path == '/search':
+            try:
+                request = json.loads(body or b'{}')
+            except ValueError:
+                raise HttpError(400, "Request body is not valid JSON")
+            if not isinstance(request, dict):
+                raise HttpError(400, "Request body must be a JSON object")
+            fields.update(request)
+        elif method != 'GET':
+            raise HttpError(405, f"{method} is not supported on {url.path}")
+
+        return await handler(fields)
+
+    # Serves requests on one connection until the client closes it
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b'\r\n\r\n')
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    break
+                except asyncio.LimitOverrunError:
+                    await self.respond(writer, 413, {'error': 'Request head too large'}, False)
+                    break
+
+                request_line, *header_lines = head.decode('latin-1').split('\r\n')
+                headers = {}
+                for line in header_lines:
+                    name, _, value = line.partition(':')
+                    if name:
+                        headers[name.strip().lower()] = value.strip()
+
+                try:
+                    method, target, version = request_line.split(' ')
+                except ValueError:
+                    await self.respond(writer, 400, {'error': 'Malformed request line'}, False)
+                    break
+                keep_alive = headers.get('connection', '').lower() != 'close' and version == 'HTTP/1.1'
+
+                try:
+                    length = int(headers.get('content-length', 0) or 0)
+                except ValueError:
+                    await self.respond(writer, 400, {'error': 'Invalid Content-Length'}, False)
+                    break
+                if length > MAX_BODY_BYTES:
+                    await self.respond(writer, 413, {'error': 'Request body too large'}, False)
+                    break
+                body = await reader.readexactly(length) if length else b''
+
+                try:
+                    status, response = 200, await self.route(method, target, body)
+                except HttpError as e:
+                    status, response = e.status, {'error': str(e)}
+                except Exception as e:
+                    status, response = 500, {'error': str(e)}
+
+                await self.respond(writer, status, response, keep_alive)
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def respond(self, writer, status, response, keep_alive):
+        body = json.dumps(response).encode('utf-8')
+        writer.write((f"HTTP/1.1 {status} {STATUS_TEXT[status]}\r\n"
+                      f"Content-Type: application/json\r\n"
+                      f"Content-Length: {len(body)}\r\n"
+                      f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n").encode('latin-1') + body)
+        await writer.drain()
+
+    # Loads the index once, then serves until cancelled
+    async def serve(self, host, port):
+        await asyncio.get_running_loop().run_in_executor(self.executor, default_engine.get_index)
+        batcher = asyncio.create_task(self.batcher.run())
+        server = await asyncio.start_server(self.handle_connection, host, port, limit=MAX_HEADER_BYTES)
+        print(f"Serving book search on http://{host}:{port}")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            batcher.cancel()
+            self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+# Starts the search service
+def main():
+    parser = argparse.ArgumentParser(description="Serve book searches over HTTP/JSON")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help="threads running searches")
+    parser.add_argument('--max-batch', type=int, default=32,
+                        help="most waiting searches answered by one batch search")
+    parser.add_argument('--batch-wait-ms', type=float, default=2.0,
+                        help="how long a batch waits for more searches once the service is under load")
+    parser.add_argument('--instrument', action='store_true',
+                        help="time every search stage, the totals are reported by /stats")
+    parser.add_argument('--memory', action='store_true', help="with --instrument, also sample memory use")
+    parser.add_argument('--trace-file', help="with --instrument, write a Chrome trace of the stages here on exit")
+    args = parser.parse_args()
+
+    if args.instrument:
+        instrumentation.enable(memory=args.memory)
+
+    service = SearchService(args.workers, args.max_batch, args.batch_wait_ms / 1000)
+    try:
+        asyncio.run(service.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if args.instrument and args.trace_file:
+            instrumentation.export_trace(args.trace_file)
+
+
+if __name__ == "__main__":
+    main()